@@ -0,0 +1,262 @@
+
+import numpy as np
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+
+# Performance regression benchmarks for the Python hot paths.
+# Runs on synthetic landmarks / generated videos, so no real dataset is needed.
+#
+#   python benchmarks/bench_hot_paths.py --output results.json
+#   python benchmarks/bench_hot_paths.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench_hot_paths.py --baseline benchmarks/baseline.json --threshold 0.2
+#
+# No baseline is committed: timings only compare on the same machine/stack, so record one
+# per machine (or CI runner) as benchmarks/baseline.json from a known-good commit and
+# keep it out of the tree. Its metadata (git commit, CPU, library versions) says where
+# it came from, and mismatches are warned about on --baseline.
+#
+# The exit code is 1 when a benchmark raises, or (with --baseline) when any benchmark's
+# median is more than `threshold` slower than the stored one. Benchmarks whose stack is
+# not installed (ImportError) are recorded as skipped; one that has a baseline timing but
+# was skipped in this run is reported as missing, and fails the run with --strict.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'dataprep'))
+sys.path.append(os.path.join(ROOT, 'training'))
+
+SEQ_LENGTH = 30
+INPUT_DIM = 171
+
+def _fake_results(rng):
+    """
+    Stand-in for MediaPipe Holistic results with both hands and pose detected.
+    """
+    def landmarks(n):
+        return SimpleNamespace(landmark=[SimpleNamespace(x=x, y=y, z=z) for x, y, z in rng.random((n, 3))])
+    return SimpleNamespace(left_hand_landmarks=landmarks(21),
+                           right_hand_landmarks=landmarks(21),
+                           pose_landmarks=landmarks(33))
+
+def _synthetic_video(path, num_frames=60, size=(320, 240)):
+    """
+    Writes a small video with a moving skin-coloured blob (content does not matter for timing).
+    """
+    import cv2
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+    for i in range(num_frames):
+        frame = np.full((size[1], size[0], 3), 40, dtype=np.uint8)
+        cv2.circle(frame, (40 + (i * 4) % (size[0] - 80), size[1] // 2), 30, (140, 170, 220), -1)
+        writer.write(frame)
+    writer.release()
+
+# Each benchmark: setup(tmp) -> (fn, units). fn is timed; units = items processed per call.
+# tmp is a scratch folder removed after the benchmark.
+
+def bench_extract_keypoints(tmp):
+    from keypoints import extract_keypoints
+    results = _fake_results(np.random.default_rng(0))
+    return (lambda: extract_keypoints(results)), 1
+
+def bench_augment_mirror_frame(tmp):
+    from keypoints import augment_mirror_frame
+    seq = np.random.default_rng(0).random((SEQ_LENGTH, INPUT_DIM))
+    # Timed the way dataprep calls it: once per frame of a window
+    return (lambda: [augment_mirror_frame(frame) for frame in seq]), SEQ_LENGTH
+
+def bench_process_video(tmp):
+    from preprocess_dataset import process_video
+    path = os.path.join(tmp, 'synthetic.mp4')
+    num_frames = 60
+    _synthetic_video(path, num_frames)
+    return (lambda: process_video(path)), num_frames
+
+def bench_augment_dataset(tmp):
+    from train_model import augment_dataset
+    rng = np.random.default_rng(0)
+    X = rng.random((512, SEQ_LENGTH, INPUT_DIM)).astype(np.float32)
+    y = np.eye(15)[rng.integers(0, 15, 512)]
+    return (lambda: augment_dataset(X, y)), len(X)
+
+def bench_train_step(tmp):
+    from tensorflow import keras
+    from train_model import build_model, BATCH_SIZE
+    rng = np.random.default_rng(0)
+    model = build_model(15)
+    model.compile(optimizer=keras.optimizers.AdamW(learning_rate=1e-3, weight_decay=1e-4),
+                  loss='categorical_crossentropy', metrics=['accuracy'])
+    X = rng.random((BATCH_SIZE, SEQ_LENGTH, INPUT_DIM)).astype(np.float32)
+    y = np.eye(15)[rng.integers(0, 15, BATCH_SIZE)].astype(np.float32)
+    return (lambda: model.train_on_batch(X, y)), BATCH_SIZE
+
+def bench_tflite_invoke(tmp):
+    import tensorflow as tf
+    from train_model import build_model, export_tflite
+    path = os.path.join(tmp, 'model.tflite')
+    export_tflite(build_model(15), path)
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=1)
+    interpreter.allocate_tensors()
+    index = interpreter.get_input_details()[0]['index']
+    sample = np.random.default_rng(0).random((1, SEQ_LENGTH, INPUT_DIM)).astype(np.float32)
+
+    def invoke():
+        interpreter.set_tensor(index, sample)
+        interpreter.invoke()
+    return invoke, 1
+
+BENCHMARKS = {
+    'extract_keypoints': (bench_extract_keypoints, 2000),
+    'augment_mirror_frame': (bench_augment_mirror_frame, 200),
+    'process_video': (bench_process_video, 3),
+    'augment_dataset': (bench_augment_dataset, 5),
+    'train_step': (bench_train_step, 20),
+    'tflite_invoke': (bench_tflite_invoke, 200),
+}
+
+def run_benchmark(name, repeats, warmup=2):
+    setup, calls = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        fn, units = setup(tmp)
+        for _ in range(warmup):
+            fn()
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            samples.append((time.perf_counter() - start) / calls)
+        del fn # Release open files (TFLite model, video) before the folder is removed
+    return {
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'mean_s': statistics.mean(samples),
+        'stdev_s': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'repeats': repeats,
+        'calls_per_repeat': calls,
+        'units_per_call': units,
+        'units_per_s': units / statistics.median(samples)
+    }
+
+def machine_metadata():
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+    }
+    for module in ['tensorflow', 'cv2', 'mediapipe']:
+        try:
+            meta[module] = __import__(module).__version__
+        except Exception:
+            meta[module] = None
+    try:
+        meta['git_commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        meta['git_commit'] = None
+    return meta
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (name, current, baseline, ratio, status) for the benchmarks of this
+    run, status being 'ok', 'regressed', 'missing' (timed in the baseline, not now) or
+    'no_baseline' (no baseline timing to compare against).
+    """
+    rows = []
+    for name, res in results.items():
+        cur = res.get('median_s')
+        base = baseline.get('results', {}).get(name, {}).get('median_s')
+        if base is None:
+            rows.append((name, cur, None, None, 'no_baseline'))
+        elif cur is None:
+            rows.append((name, None, base, None, 'missing'))
+        else:
+            ratio = cur / base
+            rows.append((name, cur, base, ratio, 'regressed' if ratio > 1.0 + threshold else 'ok'))
+    return rows
+
+def main(args):
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark '{name}', choose from {list(BENCHMARKS)}")
+        print(f"Running {name}...")
+        try:
+            results[name] = run_benchmark(name, args.repeats)
+        except ImportError as e:
+            # Missing optional stack (e.g. mediapipe on a training-only box)
+            print(f"  skipped: {e}")
+            results[name] = {'skipped': str(e)}
+            continue
+        except Exception as e:
+            print(f"  failed: {e}")
+            results[name] = {'error': str(e)}
+            continue
+        r = results[name]
+        print(f"  median {r['median_s'] * 1000:.3f} ms/call (min {r['min_s'] * 1000:.3f}, {r['units_per_s']:.1f} units/s)")
+
+    report = {'metadata': machine_metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    errors = [name for name, r in results.items() if 'error' in r]
+    if errors:
+        print(f"\nFAILED: benchmark(s) raised: {', '.join(errors)}")
+        return 1
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        for key in ['machine', 'processor', 'cpu_count']:
+            if baseline['metadata'].get(key) != report['metadata'].get(key):
+                print(f"WARNING: baseline {key} differs ({baseline['metadata'].get(key)} vs {report['metadata'].get(key)}), timings may not be comparable")
+
+        print(f"\n{'benchmark':<22} {'current_ms':>10} {'baseline_ms':>11} {'ratio':>6}")
+        regressions, missing = [], []
+        for name, cur, base, ratio, status in compare(results, baseline, args.threshold):
+            cur_ms = f"{cur * 1000:.3f}" if cur is not None else '-'
+            base_ms = f"{base * 1000:.3f}" if base is not None else '-'
+            ratio_s = f"{ratio:.2f}" if ratio is not None else '-'
+            flag = {'regressed': '  REGRESSION', 'missing': '  MISSING (skipped in this run)',
+                    'no_baseline': '  (no baseline timing)'}.get(status, '')
+            print(f"{name:<22} {cur_ms:>10} {base_ms:>11} {ratio_s:>6}{flag}")
+            if status == 'regressed':
+                regressions.append(name)
+            elif status == 'missing':
+                missing.append(name)
+        if regressions:
+            print(f"\nFAILED: {len(regressions)} hot path(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        if missing and args.strict:
+            print(f"\nFAILED (--strict): baseline benchmark(s) not measured: {', '.join(missing)}")
+            return 1
+        if missing:
+            print(f"\nWARNING: baseline benchmark(s) not measured: {', '.join(missing)}")
+        print("\nNo regressions.")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Python hot paths on synthetic data')
+    parser.add_argument('--only', help=f"Comma-separated subset of: {','.join(BENCHMARKS)}")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--save-baseline', dest='save_baseline', help='Write results as the new baseline JSON (usually benchmarks/baseline.json)')
+    parser.add_argument('--baseline', help='Compare against this baseline JSON (usually benchmarks/baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown of the median (0.2 = 20%%)')
+    parser.add_argument('--strict', action='store_true', help='Fail when a benchmark with a baseline timing was skipped')
+    sys.exit(main(parser.parse_args()))
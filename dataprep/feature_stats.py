@@ -0,0 +1,198 @@
+
+import numpy as np
+import os
+import json
+import argparse
+import matplotlib.pyplot as plt
+
+# Feature layout (Must Match preprocess_dataset.py)
+INPUT_DIM = 171
+PARTS = {
+    'Left Hand': (0, 63),
+    'Right Hand': (63, 126),
+    'Pose': (126, 171)
+}
+COORDS = ['X', 'Y', 'Z']
+
+# Fixed histogram ranges per coordinate so shards share bin edges and can be merged.
+# MediaPipe x/y are normalized to the image (0..1) but drift slightly outside it,
+# z is relative depth centred around 0. Values outside land in the under/overflow bins.
+NUM_BINS = 50
+COORD_RANGES = {
+    'X': (-0.5, 1.5),
+    'Y': (-0.5, 1.5),
+    'Z': (-1.0, 1.0)
+}
+
+def _groups():
+    """
+    Yields (part, coord, column indices) for each Part x Coord group (9 groups).
+    """
+    for part, (start, end) in PARTS.items():
+        for offset, coord in enumerate(COORDS):
+            yield part, coord, np.arange(start + offset, end, 3)
+
+GROUPS = list(_groups())
+
+class FeatureStats:
+    """
+    Online (Welford/Chan) accumulator of min/max/mean/std and fixed-bin histograms
+    for every Part x Coord group. Stats are updated window by window, can be saved
+    per shard and merged across workers without revisiting the data.
+    """
+    def __init__(self, num_bins=NUM_BINS):
+        self.num_bins = num_bins
+        n = len(GROUPS)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        # Bin 0 = underflow, bin -1 = overflow
+        self.hist = np.zeros((n, num_bins + 2), dtype=np.int64)
+        self.edges = np.array([np.linspace(*COORD_RANGES[coord], num_bins + 1) for _, coord, _ in GROUPS])
+        self.frames = 0
+
+    def update(self, sequences):
+        """
+        Adds a batch of windows.
+        Input: (N, 30, 171) or (F, 171) array (or list of (30, 171) windows)
+        All-zero frames (no detections at all) are skipped, matching the old analysis.
+        """
+        flat = np.asarray(sequences).reshape(-1, INPUT_DIM)
+        flat = flat[flat.any(axis=1)]
+        if len(flat) == 0:
+            return self
+        self.frames += len(flat)
+
+        for g, (_, _, cols) in enumerate(GROUPS):
+            vals = flat[:, cols].ravel()
+            n_b = vals.size
+            mean_b = vals.mean()
+            m2_b = np.square(vals - mean_b).sum()
+            self._combine(g, n_b, mean_b, m2_b, vals.min(), vals.max())
+
+            # np.digitize: 0 -> below first edge, num_bins + 1 -> at/above last edge
+            bins = np.digitize(vals, self.edges[g])
+            self.hist[g] += np.bincount(bins, minlength=self.num_bins + 2)
+        return self
+
+    def _combine(self, g, n_b, mean_b, m2_b, min_b, max_b):
+        # Chan et al. parallel variance update
+        n_a = self.count[g]
+        n = n_a + n_b
+        delta = mean_b - self.mean[g]
+        self.mean[g] += delta * n_b / n
+        self.m2[g] += m2_b + delta ** 2 * n_a * n_b / n
+        self.count[g] = n
+        self.min[g] = min(self.min[g], min_b)
+        self.max[g] = max(self.max[g], max_b)
+
+    def merge(self, other):
+        """
+        Merges another accumulator (e.g. from a different shard/worker) into this one.
+        """
+        if other.num_bins != self.num_bins:
+            raise ValueError(f"Cannot merge stats with {other.num_bins} bins into {self.num_bins} bins")
+        for g in range(len(GROUPS)):
+            if other.count[g] == 0:
+                continue
+            self._combine(g, other.count[g], other.mean[g], other.m2[g], other.min[g], other.max[g])
+        self.hist += other.hist
+        self.frames += other.frames
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(np.divide(self.m2, self.count, out=np.zeros_like(self.m2), where=self.count > 0))
+
+    def summary_lines(self):
+        lines = []
+        std = self.std
+        for g, (part, coord, _) in enumerate(GROUPS):
+            lines.append(f"{part} {coord}: Min={self.min[g]:.3f}, Max={self.max[g]:.3f}, Mean={self.mean[g]:.3f}, Std={std[g]:.3f}")
+        return lines
+
+    def save(self, path):
+        np.savez(path, count=self.count, mean=self.mean, m2=self.m2,
+                 min=self.min, max=self.max, hist=self.hist, edges=self.edges,
+                 frames=self.frames)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stats = cls(num_bins=data['hist'].shape[1] - 2)
+        for key in ['count', 'mean', 'm2', 'min', 'max', 'hist', 'edges']:
+            setattr(stats, key, data[key])
+        stats.frames = int(data['frames'])
+        return stats
+
+def plot_histograms(stats, output_file):
+    """
+    Plots the 3x3 grid of precomputed histograms (no raw data, no KDE).
+    """
+    fig, axes = plt.subplots(3, 3, figsize=(18, 12))
+    for g, (part, coord, _) in enumerate(GROUPS):
+        ax = axes[g // 3, g % 3]
+        edges = stats.edges[g]
+        counts = stats.hist[g, 1:-1]
+        ax.stairs(counts, edges, fill=True, color='skyblue', edgecolor='steelblue')
+        ax.set_title(f'{part} - {coord}')
+        if stats.count[g] > 0:
+            # Clamp to the observed range, like the old per-plot xlim
+            ax.set_xlim([max(stats.min[g], edges[0]), min(stats.max[g], edges[-1])])
+        outside = stats.hist[g, 0] + stats.hist[g, -1]
+        if outside:
+            ax.text(0.98, 0.95, f"{outside} out of range", transform=ax.transAxes, ha='right', va='top')
+    plt.tight_layout()
+    plt.savefig(output_file)
+    plt.close(fig)
+
+def compare_stats(ref, cur, eps=1e-6):
+    """
+    Drift comparison between two dataset versions.
+    Returns a dict per group with the mean shift (in reference std units),
+    std ratio and Population Stability Index over the shared histogram bins.
+    PSI rule of thumb: < 0.1 stable, 0.1-0.25 moderate, > 0.25 significant drift.
+    """
+    if ref.num_bins != cur.num_bins:
+        raise ValueError("Stats were computed with different binning")
+    report = {}
+    ref_std, cur_std = ref.std, cur.std
+    for g, (part, coord, _) in enumerate(GROUPS):
+        p = ref.hist[g] / max(ref.hist[g].sum(), 1) + eps
+        q = cur.hist[g] / max(cur.hist[g].sum(), 1) + eps
+        psi = float(np.sum((q - p) * np.log(q / p)))
+        report[f"{part} {coord}"] = {
+            'mean_shift_std': float((cur.mean[g] - ref.mean[g]) / (ref_std[g] + eps)),
+            'std_ratio': float(cur_std[g] / (ref_std[g] + eps)),
+            'psi': psi,
+            'drift': 'significant' if psi > 0.25 else 'moderate' if psi > 0.1 else 'stable'
+        }
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge, plot and compare feature_stats.npz files')
+    parser.add_argument('--merge', nargs='+', help='Shard stats files to merge')
+    parser.add_argument('--output', help='Where to write merged stats (.npz) and plot')
+    parser.add_argument('--compare', nargs=2, metavar=('REF', 'CUR'), help='Drift check between two stats files')
+    args = parser.parse_args()
+
+    if args.merge:
+        merged = FeatureStats.load(args.merge[0])
+        for path in args.merge[1:]:
+            merged.merge(FeatureStats.load(path))
+        for line in merged.summary_lines(): print(line)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            merged.save(os.path.join(args.output, 'feature_stats.npz'))
+            plot_histograms(merged, os.path.join(args.output, 'feature_distributions.png'))
+
+    if args.compare:
+        report = compare_stats(FeatureStats.load(args.compare[0]), FeatureStats.load(args.compare[1]))
+        for name, r in report.items():
+            print(f"{name}: PSI={r['psi']:.3f} ({r['drift']}), MeanShift={r['mean_shift_std']:+.2f} std, StdRatio={r['std_ratio']:.2f}")
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            with open(os.path.join(args.output, 'drift_report.json'), 'w') as f:
+                json.dump(report, f, indent=2)
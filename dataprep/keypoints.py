@@ -0,0 +1,73 @@
+
+import numpy as np
+
+# Feature extraction shared by preprocess_dataset.py. Kept free of cv2/mediapipe imports
+# so it can be imported (and benchmarked) without the video stack installed.
+
+POSE_INDICES = list(range(15)) # 0..14
+
+def extract_keypoints(results):
+    """
+    Extracts 171-dim feature vector from MediaPipe results.
+    Strictly matches Android implementation.
+    Output: [Left(63) | Right(63) | Pose(45)]
+    """
+    # 1. Left Hand (0-62)
+    lh = np.zeros(63)
+    if results.left_hand_landmarks:
+        temp = []
+        for lm in results.left_hand_landmarks.landmark:
+            temp.extend([lm.x, lm.y, lm.z]) # NO normalization
+        lh = np.array(temp)
+    
+    # 2. Right Hand (63-125)
+    rh = np.zeros(63)
+    if results.right_hand_landmarks:
+        temp = []
+        for lm in results.right_hand_landmarks.landmark:
+            temp.extend([lm.x, lm.y, lm.z])
+        rh = np.array(temp)
+        
+    # 3. Pose (126-170) -> First 15 landmarks
+    pose = np.zeros(45)
+    if results.pose_landmarks:
+        temp = []
+        for i in POSE_INDICES:
+            lm = results.pose_landmarks.landmark[i]
+            temp.extend([lm.x, lm.y, lm.z])
+        pose = np.array(temp)
+    
+    return np.concatenate([lh, rh, pose])
+
+def augment_mirror_frame(features):
+    """
+    Simulates mirroring by swapping Left/Right blocks and flipping X coords.
+    Input: (171,) array
+    Output: (171,) array
+    """
+    # Create copy (the reshapes below are views, flipping them must not touch the input)
+    mirrored = features.copy()
+    
+    # Extract blocks
+    lh = mirrored[0:63].reshape(-1, 3)
+    rh = mirrored[63:126].reshape(-1, 3)
+    pose = mirrored[126:171].reshape(-1, 3)
+    
+    # Flip X coordinates (Index 0 of each point) for all groups
+    # Assuming input is [0,1], mirrored becomes (1.0 - x)
+    # BUT MediaPipe normalized coords are 0..1. Android uses raw.
+    # So we do 1.0 - x.
+    lh[:, 0] = 1.0 - lh[:, 0]
+    rh[:, 0] = 1.0 - rh[:, 0]
+    pose[:, 0] = 1.0 - pose[:, 0]
+    
+    # Swap Hands: Mirrored Left becomes Right, Mirrored Right becomes Left
+    # Important: Flatten back to 1D
+    new_lh = rh.flatten()
+    new_rh = lh.flatten()
+    new_pose = pose.flatten()
+    
+    # Reassemble: Left slot gets old Right data, Right slot gets old Left data
+    mirrored_features = np.concatenate([new_lh, new_rh, new_pose])
+    
+    return mirrored_features
@@ -0,0 +1,334 @@
+
+import numpy as np
+import os
+import json
+import argparse
+
+from sequence_index import has_index, index_shards, set_shard
+
+# Compact on-disk landmark format.
+#
+# Layout inside the data folder (next to y.npy / label_map.json):
+#   landmarks.json   manifest (format, shape, block_size, compressed)
+#   X_q.npy          quantized windows (N, 30, 171), memory-mappable     [uncompressed]
+#   X_scale.npy      per-block, per-column scale  (num_blocks, 171)      [uint16 only]
+#   X_offset.npy     per-block, per-column offset (num_blocks, 171)      [uint16 only]
+#   X_blocks.npz     one compressed entry per block (q/scale/offset)     [compressed]
+#
+# uint16 code 0 is reserved for exact zero so missing-hand frames stay all-zero after
+# dequantization (the hand-presence checks rely on == 0). Codes 1..65535 map linearly
+# onto [min, max] of the non-zero values of that column within the block.
+
+MANIFEST = 'landmarks.json'
+FORMATS = ['float16', 'uint16']
+DEFAULT_BLOCK_SIZE = 1024
+UINT16_LEVELS = 65534
+RAW_FILE = 'X.npy'
+STORE_FILES = [MANIFEST, 'X_q.npy', 'X_scale.npy', 'X_offset.npy', 'X_blocks.npz', 'storage_report.json']
+
+def _quantize_block(block):
+    """
+    Input: (B, 30, 171) float array
+    Output: (codes uint16, scale (171,), offset (171,))
+    """
+    flat = block.reshape(-1, block.shape[-1])
+    nonzero = flat != 0
+    lo = np.where(nonzero, flat, np.inf).min(axis=0)
+    hi = np.where(nonzero, flat, -np.inf).max(axis=0)
+    empty = ~nonzero.any(axis=0)
+    lo[empty] = 0.0
+    hi[empty] = 0.0
+
+    scale = (hi - lo) / UINT16_LEVELS
+    scale[scale == 0] = 1.0
+    codes = np.rint((flat - lo) / scale) + 1
+    codes = np.where(nonzero, codes, 0).astype(np.uint16)
+    return codes.reshape(block.shape), scale.astype(np.float32), lo.astype(np.float32)
+
+def _dequantize_block(codes, scale, offset):
+    values = offset + (codes.astype(np.float32) - 1.0) * scale
+    return np.where(codes == 0, np.float32(0), values).astype(np.float32)
+
+def save_landmarks(X, output_path, fmt='float16', block_size=DEFAULT_BLOCK_SIZE, compress=False):
+    """
+    Writes X (N, 30, 171) in the compact format and returns the storage/accuracy report.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format '{fmt}', expected one of {FORMATS}")
+    X = np.asarray(X)
+    num_blocks = (len(X) + block_size - 1) // block_size
+    # Drop files of a previous store (e.g. X_blocks.npz when rewriting uncompressed)
+    remove_files(output_path, STORE_FILES)
+
+    q_blocks, scales, offsets = [], [], []
+    for b in range(num_blocks):
+        block = X[b * block_size:(b + 1) * block_size]
+        if fmt == 'float16':
+            q_blocks.append(block.astype(np.float16))
+        else:
+            codes, scale, offset = _quantize_block(block)
+            q_blocks.append(codes)
+            scales.append(scale)
+            offsets.append(offset)
+
+    if compress:
+        arrays = {}
+        for b, q in enumerate(q_blocks):
+            arrays[f'q_{b:05d}'] = q
+            if fmt == 'uint16':
+                arrays[f'scale_{b:05d}'] = scales[b]
+                arrays[f'offset_{b:05d}'] = offsets[b]
+        np.savez_compressed(os.path.join(output_path, 'X_blocks.npz'), **arrays)
+    else:
+        np.save(os.path.join(output_path, 'X_q.npy'), np.concatenate(q_blocks) if q_blocks else np.zeros((0,) + X.shape[1:], dtype=fmt))
+        if fmt == 'uint16':
+            empty = np.zeros((0, X.shape[-1]), dtype=np.float32)
+            np.save(os.path.join(output_path, 'X_scale.npy'), np.stack(scales) if scales else empty)
+            np.save(os.path.join(output_path, 'X_offset.npy'), np.stack(offsets) if offsets else empty)
+
+    manifest = {
+        'format': fmt,
+        'shape': list(X.shape),
+        'block_size': block_size,
+        'num_blocks': num_blocks,
+        'compressed': compress
+    }
+    with open(os.path.join(output_path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    report = quantization_report(X, LandmarkStore(output_path))
+    with open(os.path.join(output_path, 'storage_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def quantization_report(X, store):
+    """
+    Measures reconstruction error and disk size against a float64 X.npy.
+    """
+    max_err = 0.0
+    sum_abs = 0.0
+    sum_sq = 0.0
+    zeros_kept = True
+    for start, batch in store.iter_batches(store.block_size):
+        ref = np.asarray(X[start:start + len(batch)], dtype=np.float64)
+        err = np.abs(batch.astype(np.float64) - ref)
+        max_err = max(max_err, float(err.max()) if err.size else 0.0)
+        sum_abs += float(err.sum())
+        sum_sq += float(np.square(err).sum())
+        zeros_kept &= bool(np.array_equal(batch == 0, ref == 0))
+
+    count = max(int(np.prod(X.shape)), 1)
+    raw_bytes = count * 8
+    stored_bytes = store.disk_bytes()
+    return {
+        'format': store.format,
+        'compressed': store.compressed,
+        'float64_bytes': raw_bytes,
+        'stored_bytes': stored_bytes,
+        'reduction': raw_bytes / max(stored_bytes, 1),
+        'max_abs_error': max_err,
+        'mean_abs_error': sum_abs / count,
+        'rmse': float(np.sqrt(sum_sq / count)),
+        'zero_frames_preserved': zeros_kept
+    }
+
+def model_check(data_path, X, model_path, labels_path=None, batch_size=256):
+    """
+    Accuracy impact of the compact store in data_path: predictions of a trained Keras model
+    on the float64 windows X vs the dequantized store. Targets are mapped by class name
+    through the model's label_mapping2.txt (default: next to the model), so fine-tuned or
+    subset models score correctly; windows of classes the model does not know are skipped.
+    """
+    import sys
+    from tensorflow import keras
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'training'))
+    from train_model import read_label_mapping
+
+    with open(os.path.join(data_path, 'label_map.json'), 'r') as f:
+        label_map = json.load(f)
+    labels_path = labels_path or os.path.join(os.path.dirname(os.path.abspath(model_path)), 'label_mapping2.txt')
+    model_labels = read_label_mapping(labels_path) if os.path.exists(labels_path) else label_map
+    names = {idx: label for label, idx in label_map.items()}
+    y = np.load(os.path.join(data_path, 'y.npy'))
+    targets = np.array([model_labels.get(names[int(l)], -1) for l in y], dtype=np.int64)
+
+    model = keras.models.load_model(model_path)
+    store = LandmarkStore(data_path)
+    pred_raw, pred_store = [], []
+    for start, batch in store.iter_batches(store.block_size):
+        ref = np.asarray(X[start:start + len(batch)], dtype=np.float64)
+        pred_raw.append(np.argmax(model.predict(ref, batch_size=batch_size, verbose=0), axis=1))
+        pred_store.append(np.argmax(model.predict(batch, batch_size=batch_size, verbose=0), axis=1))
+    pred_raw = np.concatenate(pred_raw) if pred_raw else np.zeros(0, dtype=np.int64)
+    pred_store = np.concatenate(pred_store) if pred_store else np.zeros(0, dtype=np.int64)
+
+    known = targets >= 0
+    acc_raw = float(np.mean(pred_raw[known] == targets[known])) if known.any() else None
+    acc_store = float(np.mean(pred_store[known] == targets[known])) if known.any() else None
+    return {
+        'model': model_path,
+        'windows': len(targets),
+        'scored': int(known.sum()),
+        'accuracy_float64': acc_raw,
+        'accuracy_store': acc_store,
+        'accuracy_delta': acc_store - acc_raw if known.any() else None,
+        'prediction_agreement': float(np.mean(pred_raw == pred_store)) if len(targets) else None
+    }
+
+class LandmarkStore:
+    """
+    Reader for the compact format. Batches are dequantized on the fly into float32;
+    uncompressed stores are memory-mapped so only the requested rows are read.
+    """
+    def __init__(self, data_path):
+        self.data_path = data_path
+        with open(os.path.join(data_path, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        self.format = manifest['format']
+        self.shape = tuple(manifest['shape'])
+        self.block_size = manifest['block_size']
+        self.num_blocks = manifest['num_blocks']
+        self.compressed = manifest['compressed']
+
+        if self.compressed:
+            self._npz = np.load(os.path.join(data_path, 'X_blocks.npz'))
+        else:
+            self._q = np.load(os.path.join(data_path, 'X_q.npy'), mmap_mode='r')
+            if self.format == 'uint16':
+                self._scale = np.load(os.path.join(data_path, 'X_scale.npy'))
+                self._offset = np.load(os.path.join(data_path, 'X_offset.npy'))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def disk_bytes(self):
+        names = ['X_blocks.npz'] if self.compressed else ['X_q.npy', 'X_scale.npy', 'X_offset.npy']
+        paths = [os.path.join(self.data_path, n) for n in names]
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    def _block(self, b):
+        """
+        Returns block b dequantized to float32.
+        """
+        if self.compressed:
+            q = self._npz[f'q_{b:05d}']
+            if self.format == 'float16':
+                return q.astype(np.float32)
+            return _dequantize_block(q, self._npz[f'scale_{b:05d}'], self._npz[f'offset_{b:05d}'])
+        q = self._q[b * self.block_size:(b + 1) * self.block_size]
+        if self.format == 'float16':
+            return q.astype(np.float32)
+        return _dequantize_block(q, self._scale[b], self._offset[b])
+
+    def read(self, indices):
+        """
+        Returns the requested windows as float32 (len(indices), 30, 171), in the given order.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices),) + self.shape[1:], dtype=np.float32)
+        blocks = indices // self.block_size
+        for b in np.unique(blocks):
+            pos = np.nonzero(blocks == b)[0]
+            rows = indices[pos] - b * self.block_size
+            if self.compressed:
+                out[pos] = self._block(b)[rows]
+                continue
+            # Memory-mapped: touch only the requested rows
+            q = self._q[indices[pos]]
+            if self.format == 'float16':
+                out[pos] = q.astype(np.float32)
+            else:
+                out[pos] = _dequantize_block(q, self._scale[b], self._offset[b])
+        return out
+
+    def iter_batches(self, batch_size, indices=None):
+        """
+        Yields (start, float32 batch). Without indices, walks the store block by block
+        so compressed blocks are decompressed exactly once.
+        """
+        if indices is not None:
+            for start in range(0, len(indices), batch_size):
+                yield start, self.read(indices[start:start + batch_size])
+            return
+        for b in range(self.num_blocks):
+            block = self._block(b)
+            for offset in range(0, len(block), batch_size):
+                yield b * self.block_size + offset, block[offset:offset + batch_size]
+
+    def load_all(self):
+        out = np.empty(self.shape, dtype=np.float32)
+        for start, batch in self.iter_batches(self.block_size):
+            out[start:start + len(batch)] = batch
+        return out
+
+def has_store(data_path):
+    return os.path.exists(os.path.join(data_path, MANIFEST))
+
+def remove_files(data_path, names):
+    for name in names:
+        path = os.path.join(data_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def resolve_shard(data_path):
+    """
+    Which file holds X: the shard recorded in sequence_index.db when present (its offsets
+    index that array), otherwise whichever of X.npy / compact store exists (newest if both).
+    """
+    if has_index(data_path):
+        shards = index_shards(data_path)
+        if len(shards) > 1:
+            raise ValueError(f"sequence_index.db in {data_path} references several shards: {shards}")
+        if shards:
+            return shards[0]
+    raw = os.path.join(data_path, RAW_FILE)
+    manifest = os.path.join(data_path, MANIFEST)
+    if os.path.exists(raw) and os.path.exists(manifest):
+        return RAW_FILE if os.path.getmtime(raw) >= os.path.getmtime(manifest) else MANIFEST
+    return MANIFEST if os.path.exists(manifest) else RAW_FILE
+
+def load_X(data_path, indices=None):
+    """
+    Loads windows from a data folder (X.npy or the compact store, see resolve_shard).
+    Always returns float32.
+    """
+    if resolve_shard(data_path) == MANIFEST:
+        store = LandmarkStore(data_path)
+        return store.load_all() if indices is None else store.read(indices)
+    X = np.load(os.path.join(data_path, RAW_FILE), mmap_mode='r')
+    if indices is not None:
+        X = X[np.asarray(indices)]
+    return np.asarray(X, dtype=np.float32)
+
+def print_report(report):
+    print(f"Storage: {report['format']}{' + compressed' if report['compressed'] else ''}")
+    print(f"  Size: {report['stored_bytes'] / 1e6:.2f} MB (float64: {report['float64_bytes'] / 1e6:.2f} MB, {report['reduction']:.1f}x smaller)")
+    print(f"  Error: Max={report['max_abs_error']:.2e}, Mean={report['mean_abs_error']:.2e}, RMSE={report['rmse']:.2e}")
+    print(f"  Zero frames preserved: {report['zero_frames_preserved']}")
+    check = report.get('model_check')
+    if check and check['scored']:
+        print(f"  Model accuracy: float64 {check['accuracy_float64']:.4f}, store {check['accuracy_store']:.4f} "
+              f"({check['accuracy_delta']:+.4f}) on {check['scored']} windows")
+    if check and check['prediction_agreement'] is not None:
+        print(f"  Prediction agreement: {check['prediction_agreement']:.2%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert an existing X.npy into the compact landmark format')
+    parser.add_argument('--data', required=True, help='Folder with X.npy')
+    parser.add_argument('--format', choices=FORMATS, default='uint16')
+    parser.add_argument('--block_size', type=int, default=DEFAULT_BLOCK_SIZE, help='Windows per scale/offset block')
+    parser.add_argument('--compress', action='store_true', help='Chunk-compress blocks (disables memory mapping)')
+    parser.add_argument('--model', help='Trained .keras model: also report accuracy on float64 X vs the store')
+    parser.add_argument('--labels', help='label_mapping2.txt of --model (default: next to the model)')
+    args = parser.parse_args()
+
+    X = np.load(os.path.join(args.data, RAW_FILE), mmap_mode='r')
+    report = save_landmarks(X, args.data, args.format, args.block_size, args.compress)
+    if args.model:
+        report['model_check'] = model_check(args.data, X, args.model, args.labels)
+        with open(os.path.join(args.data, 'storage_report.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+    print_report(report)
+    # X.npy is kept; the index now points readers at the store
+    if has_index(args.data):
+        set_shard(args.data, MANIFEST)
@@ -7,13 +7,14 @@ import json
 import logging
 import argparse
 from tqdm import tqdm
-import matplotlib.pyplot as plt
-import seaborn as sns
+from feature_stats import FeatureStats, plot_histograms
+from landmark_store import save_landmarks, print_report, remove_files, FORMATS, MANIFEST, RAW_FILE, STORE_FILES
+from sequence_index import write_index, hand_counts
+from keypoints import extract_keypoints, augment_mirror_frame
 
 # Constants (Must Match Android Spec)
 SEQUENCE_LENGTH = 30
 INPUT_DIM = 171
-POSE_INDICES = list(range(15)) # 0..14
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,80 +22,17 @@ logger = logging.getLogger(__name__)
 
 mp_holistic = mp.solutions.holistic
 
-def extract_keypoints(results):
-    """
-    Extracts 171-dim feature vector from MediaPipe results.
-    Strictly matches Android implementation.
-    Output: [Left(63) | Right(63) | Pose(45)]
-    """
-    # 1. Left Hand (0-62)
-    lh = np.zeros(63)
-    if results.left_hand_landmarks:
-        temp = []
-        for lm in results.left_hand_landmarks.landmark:
-            temp.extend([lm.x, lm.y, lm.z]) # NO normalization
-        lh = np.array(temp)
-    
-    # 2. Right Hand (63-125)
-    rh = np.zeros(63)
-    if results.right_hand_landmarks:
-        temp = []
-        for lm in results.right_hand_landmarks.landmark:
-            temp.extend([lm.x, lm.y, lm.z])
-        rh = np.array(temp)
-        
-    # 3. Pose (126-170) -> First 15 landmarks
-    pose = np.zeros(45)
-    if results.pose_landmarks:
-        temp = []
-        for i in POSE_INDICES:
-            lm = results.pose_landmarks.landmark[i]
-            temp.extend([lm.x, lm.y, lm.z])
-        pose = np.array(temp)
-    
-    return np.concatenate([lh, rh, pose])
-
-def augment_mirror_frame(features):
-    """
-    Simulates mirroring by swapping Left/Right blocks and flipping X coords.
-    Input: (171,) array
-    Output: (171,) array
-    """
-    # Create copy
-    mirrored = features.copy()
-    
-    # Extract blocks
-    lh = features[0:63].reshape(-1, 3)
-    rh = features[63:126].reshape(-1, 3)
-    pose = features[126:171].reshape(-1, 3)
-    
-    # Flip X coordinates (Index 0 of each point) for all groups
-    # Assuming input is [0,1], mirrored becomes (1.0 - x)
-    # BUT MediaPipe normalized coords are 0..1. Android uses raw.
-    # So we do 1.0 - x.
-    lh[:, 0] = 1.0 - lh[:, 0]
-    rh[:, 0] = 1.0 - rh[:, 0]
-    pose[:, 0] = 1.0 - pose[:, 0]
-    
-    # Swap Hands: Mirrored Left becomes Right, Mirrored Right becomes Left
-    # Important: Flatten back to 1D
-    new_lh = rh.flatten()
-    new_rh = lh.flatten()
-    new_pose = pose.flatten()
-    
-    # Reassemble: Left slot gets old Right data, Right slot gets old Left data
-    mirrored_features = np.concatenate([new_lh, new_rh, new_pose])
-    
-    return mirrored_features
-
-def process_video(file_path):
+def process_video(file_path, return_ranges=False):
     """
     Processes a single video file.
     Returns: List of sequences (N, 30, 171)
+             (+ list of (first_frame, last_frame) per sequence if return_ranges)
     """
     cap = cv2.VideoCapture(file_path)
     sequences = []
+    ranges = []
     frame_window = [] # Sliding buffer
+    frame_idx = -1
     
     # Video Mode context
     with mp_holistic.Holistic(
@@ -108,6 +46,7 @@ def process_video(file_path):
             ret, frame = cap.read()
             if not ret:
                 break
+            frame_idx += 1
             
             # Convert color
             image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -132,73 +71,39 @@ def process_video(file_path):
                     
             if len(frame_window) == SEQUENCE_LENGTH:
                 sequences.append(np.array(frame_window))
+                ranges.append((frame_idx - SEQUENCE_LENGTH + 1, frame_idx))
                 # Slide window: Remove first item (Overlap striding)
                 frame_window.pop(0) 
                 
     cap.release()
+    if return_ranges:
+        return sequences, ranges
     return sequences
 
-def analyze_features(X, output_path):
+def analyze_features(stats, output_path):
     """
-    Plots histograms of X, Y, Z for Left Hand, Right Hand, Pose.
+    Plots histograms of X, Y, Z for Left Hand, Right Hand, Pose
+    from a FeatureStats accumulator filled while windows were produced.
     """
     logger.info("Generating feature distribution plots...")
     
-    # Indices
-    indices = {
-        'Left Hand': (0, 63),
-        'Right Hand': (63, 126),
-        'Pose': (126, 171)
-    }
-    
-    # Flatten across samples and time: [N*30, 171]
-    flat_X = X.reshape(-1, 171)
-    # Remove all-zero padding frames for stats (approx)
-    mask = ~np.all(flat_X == 0, axis=1)
-    valid_X = flat_X[mask]
-    
-    if len(valid_X) == 0:
+    if stats.frames == 0:
         logger.warning("No valid frames for analysis!")
         return
 
-    fig, axes = plt.subplots(3, 3, figsize=(18, 12))
-    coords = ['X', 'Y', 'Z']
-    
-    stats_log = []
-    
-    for row, (part, (start, end)) in enumerate(indices.items()):
-        # Extract part data: [Frames, Dims]
-        part_data = valid_X[:, start:end]
-        
-        # Reshape to (Points, 3) 
-        # Left/Right: 21 points, Pose: 15 points
-        num_points = (end - start) // 3
-        part_reshaped = part_data.reshape(-1, num_points, 3)
-        
-        # Flatten by coordinate
-        for col, coord in enumerate(coords):
-            vals = part_reshaped[:, :, col].flatten()
-            
-            # Plot
-            ax = axes[row, col]
-            sns.histplot(vals, bins=50, ax=ax, kde=True, color='skyblue')
-            ax.set_title(f'{part} - {coord}')
-            ax.set_xlim([np.min(vals), np.max(vals)])
-            
-            # Stats
-            stat = f"{part} {coord}: Min={np.min(vals):.3f}, Max={np.max(vals):.3f}, Mean={np.mean(vals):.3f}, Std={np.std(vals):.3f}"
-            stats_log.append(stat)
-            
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_path, 'feature_distributions.png'))
+    plot_histograms(stats, os.path.join(output_path, 'feature_distributions.png'))
     logger.info("Saved feature_distributions.png")
     
+    # Mergeable stats for shard merging / drift comparison (see feature_stats.py)
+    stats.save(os.path.join(output_path, 'feature_stats.npz'))
+    
+    stats_log = stats.summary_lines()
     with open(os.path.join(output_path, 'feature_stats.txt'), 'w') as f:
         f.write("\n".join(stats_log))
     for s in stats_log: print(s)
 
 
-def main(dataset_path, output_path, debug_dump=False):
+def main(dataset_path, output_path, debug_dump=False, storage='npy', compress=False):
     # Ensure dir exists
     os.makedirs(output_path, exist_ok=True)
     
@@ -220,6 +125,8 @@ def main(dataset_path, output_path, debug_dump=False):
         
     X_data = []
     y_data = []
+    stats = FeatureStats()
+    index_rows = [] # One per window, in X order (see sequence_index.py)
     
     print("Starting Processing...")
     
@@ -236,7 +143,7 @@ def main(dataset_path, output_path, debug_dump=False):
              vid_path = os.path.join(action_path, video)
              
              # Process Original
-             seqs = process_video(vid_path)
+             seqs, frame_ranges = process_video(vid_path, return_ranges=True)
              if len(seqs) == 0: continue
              
              # Debug Dump: First valid sequence found
@@ -257,10 +164,28 @@ def main(dataset_path, output_path, debug_dump=False):
              X_data.extend(seqs)
              y_data.extend([label_map[action]] * len(seqs))
              
+             # Hand presence from the original windows; mirroring swaps the hands
+             # (and maps missing-hand zeros to x = 1.0, so it can't be counted afterwards)
+             counts = [hand_counts(seq) for seq in seqs]
+             
              # Augmentation
              mirrored_seqs = [np.array([augment_mirror_frame(frame) for frame in seq]) for seq in seqs]
              X_data.extend(mirrored_seqs)
              y_data.extend([label_map[action]] * len(mirrored_seqs))
+             
+             for mirrored in (0, 1):
+                 for (left, right), (start, end) in zip(counts, frame_ranges):
+                     if mirrored:
+                         left, right = right, left
+                     index_rows.append({
+                         'offset': len(index_rows), 'class_name': action, 'label': label_map[action],
+                         'video': video, 'frame_start': start, 'frame_end': end,
+                         'left_hand_frames': left, 'right_hand_frames': right, 'mirrored': mirrored
+                     })
+             
+             # Online stats (no full-dataset flatten later)
+             stats.update(seqs)
+             stats.update(mirrored_seqs)
 
     if len(X_data) == 0:
         print("No data found!")
@@ -272,16 +197,32 @@ def main(dataset_path, output_path, debug_dump=False):
     print(f"Complete. X Shape: {X.shape}, y Shape: {y.shape}")
     
     # Diagnostic Plots
-    analyze_features(X, output_path)
-    
-    # Save
-    np.save(os.path.join(output_path, 'X.npy'), X)
+    analyze_features(stats, output_path)
+    
+    # Save (removing the other format's files so a stale X is never picked up)
+    if storage == 'npy':
+        remove_files(output_path, STORE_FILES)
+        np.save(os.path.join(output_path, RAW_FILE), X)
+    else:
+        remove_files(output_path, [RAW_FILE])
+        # Compact quantized store (see landmark_store.py), train_model.py reads either
+        report = save_landmarks(X, output_path, storage, compress=compress)
+        print_report(report)
     np.save(os.path.join(output_path, 'y.npy'), y)
+    
+    # Sequence index for subset selection without loading X
+    shard = RAW_FILE if storage == 'npy' else MANIFEST
+    for row in index_rows:
+        row['shard'] = shard
+    write_index(output_path, index_rows)
+    print(f"Indexed {len(index_rows)} sequences.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', required=True, help='Path to dataset folders')
     parser.add_argument('--output', required=True, help='Path to save .npy files')
     parser.add_argument('--debug', action='store_true', help='Enable debug dumping')
+    parser.add_argument('--storage', choices=['npy'] + FORMATS, default='npy', help='X storage: float64 X.npy or compact quantized store')
+    parser.add_argument('--compress', action='store_true', help='Chunk-compress the quantized store')
     args = parser.parse_args()
-    main(args.dataset, args.output, args.debug)
+    main(args.dataset, args.output, args.debug, args.storage, args.compress)
@@ -0,0 +1,142 @@
+
+import numpy as np
+import os
+import sqlite3
+import argparse
+
+# One row per window in X (same order), written by preprocess_dataset.py.
+# Lets training/evaluation pick a subset by class, video, frame range, hand presence
+# or augmentation without loading X.npy: the matching offsets are read via memmap.
+
+INDEX_FILE = 'sequence_index.db'
+
+SCHEMA = """
+CREATE TABLE sequences (
+    id INTEGER PRIMARY KEY,
+    shard TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    class_name TEXT NOT NULL,
+    label INTEGER NOT NULL,
+    video TEXT NOT NULL,
+    frame_start INTEGER NOT NULL,
+    frame_end INTEGER NOT NULL,
+    left_hand_frames INTEGER NOT NULL,
+    right_hand_frames INTEGER NOT NULL,
+    mirrored INTEGER NOT NULL
+);
+CREATE INDEX idx_sequences_class ON sequences (class_name);
+CREATE INDEX idx_sequences_video ON sequences (video);
+"""
+
+COLUMNS = ['shard', 'offset', 'class_name', 'label', 'video', 'frame_start', 'frame_end',
+           'left_hand_frames', 'right_hand_frames', 'mirrored']
+
+def hand_counts(seq):
+    """
+    Number of frames in a (30, 171) window with left / right hand landmarks.
+    """
+    return int(np.count_nonzero(seq[:, 0:63].any(axis=1))), int(np.count_nonzero(seq[:, 63:126].any(axis=1)))
+
+def write_index(output_path, rows):
+    """
+    Writes rows (dicts keyed by COLUMNS) to a fresh sequence_index.db.
+    """
+    db_path = os.path.join(output_path, INDEX_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(SCHEMA)
+        placeholders = ', '.join('?' * len(COLUMNS))
+        conn.executemany(
+            f"INSERT INTO sequences ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            ([row[c] for c in COLUMNS] for row in rows)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
+
+def has_index(data_path):
+    return os.path.exists(os.path.join(data_path, INDEX_FILE))
+
+def index_shards(data_path):
+    """
+    Distinct shard names referenced by the index (the file X lives in).
+    """
+    conn = sqlite3.connect(f"file:{os.path.join(data_path, INDEX_FILE)}?mode=ro", uri=True)
+    try:
+        return [r[0] for r in conn.execute("SELECT DISTINCT shard FROM sequences")]
+    finally:
+        conn.close()
+
+def set_shard(data_path, shard):
+    """
+    Points every row at a new shard, e.g. after converting X.npy to the compact store.
+    """
+    conn = sqlite3.connect(os.path.join(data_path, INDEX_FILE))
+    try:
+        conn.execute("UPDATE sequences SET shard = ?", (shard,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _select(data_path, columns, classes=None, where=None, params=()):
+    """
+    Runs SELECT columns over the matching windows, ordered by offset.
+    """
+    if not has_index(data_path):
+        raise FileNotFoundError(f"No {INDEX_FILE} in {data_path}, re-run preprocess_dataset.py")
+
+    conditions = []
+    args = list(params)
+    if classes:
+        conditions.append(f"class_name IN ({', '.join('?' * len(classes))})")
+        args = list(classes) + args
+    if where:
+        conditions.append(f"({where})")
+    sql = f"SELECT {', '.join(columns)} FROM sequences"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY offset"
+
+    conn = sqlite3.connect(f"file:{os.path.join(data_path, INDEX_FILE)}?mode=ro", uri=True)
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+def query_sequences(data_path, classes=None, where=None, params=()):
+    """
+    Returns (offsets, labels, class_names) of the matching windows, sorted by offset
+    so memory-mapped reads stay sequential.
+    classes: optional list of class names
+    where: optional raw SQL condition over the sequences columns,
+           e.g. "mirrored = 0 AND left_hand_frames >= 20" or "video LIKE 'signer3_%'"
+    """
+    rows = _select(data_path, ['offset', 'label', 'class_name'], classes, where, params)
+    offsets = np.array([r[0] for r in rows], dtype=np.int64)
+    labels = np.array([r[1] for r in rows], dtype=np.int64)
+    return offsets, labels, [r[2] for r in rows]
+
+def query_videos(data_path, classes=None, where=None, params=()):
+    """
+    Source video of each matching window ("class_name/video"), in the same order as
+    query_sequences. Windows of one video (including mirrored copies) share a value,
+    so it can be used as a group key when splitting train/validation.
+    """
+    rows = _select(data_path, ['class_name', 'video'], classes, where, params)
+    return [f"{r[0]}/{r[1]}" for r in rows]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect sequence_index.db')
+    parser.add_argument('--data', required=True, help='Folder with sequence_index.db')
+    parser.add_argument('--classes', help='Comma-separated class names')
+    parser.add_argument('--where', help='SQL condition over the sequences table')
+    args = parser.parse_args()
+
+    classes = args.classes.split(',') if args.classes else None
+    offsets, labels, names = query_sequences(args.data, classes, args.where)
+    print(f"Matched {len(offsets)} sequences")
+    for name in sorted(set(names)):
+        print(f"  {name}: {names.count(name)}")
@@ -0,0 +1,236 @@
+
+import numpy as np
+import os
+import json
+import csv
+import argparse
+from tensorflow import keras
+from keras import layers
+
+from train_model import (build_model, load_dataset, augment_dataset, export_tflite,
+                         measure_tflite_latency, read_label_mapping, save_label_mapping,
+                         _labels_by_index, BATCH_SIZE)
+from sequence_index import has_index, query_videos
+from sweep import make_folds
+
+# Structured (unit/channel-level) pruning of a build_model() network.
+#
+# Three unit groups are pruned, each rebuilt as a physically narrower layer:
+#   1. Residual width: projection Dense + Conv1D output channels (tied by the skip Add),
+#      with the matching BatchNorm channels and BiGRU input rows.
+#   2. Head Dense(512) units, with its BatchNorm and the input rows of Dense(256).
+#   3. Head Dense(256) units, with the input rows of the softmax layer.
+# The BiGRU and attention sizes are kept: the BiGRU output width is tied to the attention
+# output through the residual Add + LayerNormalization, so it cannot shrink on its own.
+# Units are ranked by weight norm (scaled by |BN gamma| where a BatchNorm follows).
+
+ROUND_TO = 8 # Keep widths SIMD friendly
+
+def _kept(scores, sparsity):
+    n = len(scores)
+    keep = int(np.ceil(n * (1.0 - sparsity) / ROUND_TO) * ROUND_TO)
+    keep = min(max(keep, ROUND_TO), n)
+    return np.sort(np.argsort(scores)[::-1][:keep])
+
+def _find_layers(model):
+    dense = [l for l in model.layers if isinstance(l, layers.Dense)]
+    bns = [l for l in model.layers if isinstance(l, layers.BatchNormalization)]
+    conv = [l for l in model.layers if isinstance(l, layers.Conv1D)]
+    bigru = [l for l in model.layers if isinstance(l, layers.Bidirectional)]
+    mha = [l for l in model.layers if isinstance(l, layers.MultiHeadAttention)]
+    drops = [l for l in model.layers if type(l) is layers.Dropout]
+    spatial = [l for l in model.layers if isinstance(l, layers.SpatialDropout1D)]
+    if len(dense) != 4 or len(bns) != 3 or len(conv) != 1 or len(bigru) != 1 or len(mha) != 1:
+        raise ValueError("Model does not match the build_model() architecture")
+    return {
+        'proj': dense[0], 'head1': dense[1], 'head2': dense[2], 'out': dense[3],
+        'bn_proj': bns[0], 'bn_gru': bns[1], 'bn_head': bns[2],
+        'conv': conv[0], 'bigru': bigru[0], 'mha': mha[0],
+        'drops': drops, 'spatial': spatial
+    }
+
+def unit_scores(model):
+    """
+    Importance score per unit for each prunable group.
+    """
+    L = _find_layers(model)
+    proj_k = L['proj'].get_weights()[0]          # (171, W)
+    conv_k = L['conv'].get_weights()[0]          # (3, W, W)
+    gamma_proj = np.abs(L['bn_proj'].get_weights()[0])
+    head1_k = L['head1'].get_weights()[0]        # (W_gru, H1)
+    gamma_head = np.abs(L['bn_head'].get_weights()[0])
+    head2_k = L['head2'].get_weights()[0]        # (H1, H2)
+    out_k = L['out'].get_weights()[0]            # (H2, C)
+    return {
+        'width': gamma_proj * np.linalg.norm(proj_k, axis=0) + np.linalg.norm(conv_k, axis=(0, 1)),
+        'head1': gamma_head * np.linalg.norm(head1_k, axis=0),
+        'head2': np.linalg.norm(head2_k, axis=0) * np.linalg.norm(out_k, axis=1)
+    }
+
+def prune(model, sparsity):
+    """
+    Returns a physically smaller copy of model with `sparsity` of the units removed
+    from each prunable group, carrying over the surviving weights.
+    """
+    L = _find_layers(model)
+    scores = unit_scores(model)
+    R = _kept(scores['width'], sparsity)
+    H1 = _kept(scores['head1'], sparsity)
+    H2 = _kept(scores['head2'], sparsity)
+
+    gru = L['bigru'].forward_layer
+    mha_cfg = L['mha'].get_config()
+    pruned = build_model(
+        L['out'].units,
+        width=len(R),
+        gru_units=gru.units,
+        num_heads=mha_cfg['num_heads'],
+        key_dim=mha_cfg['key_dim'],
+        dense_units=(len(H1), len(H2)),
+        spatial_dropout=L['spatial'][0].rate if L['spatial'] else 0.2,
+        dropout=tuple(d.rate for d in L['drops'][:2]) if len(L['drops']) >= 2 else (0.4, 0.3)
+    )
+    P = _find_layers(pruned)
+
+    def bn_slice(bn, idx):
+        return [w[idx] for w in bn.get_weights()]
+
+    new_weights = {
+        'proj': [L['proj'].get_weights()[0][:, R], L['proj'].get_weights()[1][R]],
+        'bn_proj': bn_slice(L['bn_proj'], R),
+        'conv': [L['conv'].get_weights()[0][:, R][:, :, R], L['conv'].get_weights()[1][R]],
+        'head1': [L['head1'].get_weights()[0][:, H1], L['head1'].get_weights()[1][H1]],
+        'bn_head': bn_slice(L['bn_head'], H1),
+        'head2': [L['head2'].get_weights()[0][H1][:, H2], L['head2'].get_weights()[1][H2]],
+        'out': [L['out'].get_weights()[0][H2], L['out'].get_weights()[1]],
+    }
+    # BiGRU: [fw kernel, fw recurrent, fw bias, bw kernel, bw recurrent, bw bias]; only the
+    # input kernels see the pruned residual channels
+    gru_w = L['bigru'].get_weights()
+    gru_w[0] = gru_w[0][R]
+    gru_w[3] = gru_w[3][R]
+    new_weights['bigru'] = gru_w
+
+    for key, weights in new_weights.items():
+        P[key].set_weights(weights)
+    for key in ['bn_gru', 'mha']:
+        P[key].set_weights(L[key].get_weights())
+    ln_old = [l for l in model.layers if isinstance(l, layers.LayerNormalization)]
+    ln_new = [l for l in pruned.layers if isinstance(l, layers.LayerNormalization)]
+    for old, new in zip(ln_old, ln_new):
+        new.set_weights(old.get_weights())
+    return pruned
+
+def main(args):
+    os.makedirs(args.output, exist_ok=True)
+    base = keras.models.load_model(args.model)
+
+    classes = args.classes.split(',') if args.classes else None
+    X, y, label_map = load_dataset(args.data, classes, args.where)
+
+    # Targets in the model's own output order (fine-tuned models append new classes)
+    labels_path = args.labels or os.path.join(os.path.dirname(os.path.abspath(args.model)), 'label_mapping2.txt')
+    model_labels = read_label_mapping(labels_path)
+    if len(model_labels) != base.output_shape[-1]:
+        raise ValueError(f"{labels_path} lists {len(model_labels)} classes, model has {base.output_shape[-1]} outputs")
+    names = _labels_by_index(label_map, y)
+    known = np.array([name in model_labels for name in names], dtype=bool)
+    if not known.all():
+        unknown = sorted(set(name for name, k in zip(names, known) if not k))
+        print(f"Skipping {int((~known).sum())} windows of classes the model does not know: {unknown}")
+    X = X[known]
+    y = np.array([model_labels[name] for name in names if name in model_labels], dtype=np.int64)
+    save_label_mapping(model_labels, os.path.join(args.output, 'label_mapping2.txt'))
+
+    # Split the original windows before augmenting, grouped by source video: a held-out test
+    # set for the report, and an early-stopping validation set carved from the rest
+    groups = None
+    if has_index(args.data):
+        groups = np.array(query_videos(args.data, classes, args.where))[known]
+    else:
+        print("No sequence_index.db: splitting by window, windows of one video may straddle the splits")
+    train_idx, test_idx = make_folds(y, 1, groups)[0]
+    sub_train, sub_val = make_folds(y[train_idx], 1, groups[train_idx] if groups is not None else None)[0]
+    train_idx, val_idx = train_idx[sub_train], train_idx[sub_val]
+
+    y = keras.utils.to_categorical(y, len(model_labels))
+    X_train, y_train = augment_dataset(X[train_idx], y[train_idx])
+    X_val, y_val = X[val_idx], y[val_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+    print(f"Fine-tuning on {len(X_train)} augmented windows, early stopping on {len(X_val)}, reporting on {len(X_test)}")
+
+    def report_row(model, sparsity, tag):
+        model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        _, acc = model.evaluate(X_test, y_test, batch_size=256, verbose=0)
+        tflite_path = os.path.join(args.output, f'model_{tag}.tflite')
+        size = export_tflite(model, tflite_path)
+        return {
+            'sparsity': sparsity,
+            'params': int(model.count_params()),
+            'tflite_kb': size / 1024,
+            'latency_ms': measure_tflite_latency(tflite_path),
+            'test_accuracy': float(acc),
+            'tflite': tflite_path
+        }
+
+    rows = [report_row(base, 0.0, 'base')]
+    print(f"Base: {rows[0]['params']:,} params, {rows[0]['latency_ms']:.2f} ms, test acc {rows[0]['test_accuracy']:.4f}")
+
+    sparsities = sorted(float(s) for s in args.sparsity.split(','))
+    # Latency-aware target: no pruning needed if the base model is already within budget
+    if args.latency_budget_ms and rows[0]['latency_ms'] <= args.latency_budget_ms:
+        print(f"Latency budget {args.latency_budget_ms} ms already met by the base model, skipping pruning")
+        sparsities = []
+
+    for sparsity in sparsities:
+        pruned = prune(base, sparsity)
+        pruned.compile(optimizer=keras.optimizers.AdamW(learning_rate=args.lr, weight_decay=1e-4),
+                       loss='categorical_crossentropy', metrics=['accuracy'])
+        pruned.fit(
+            X_train, y_train,
+            validation_data=(X_val, y_val),
+            epochs=args.finetune_epochs,
+            batch_size=BATCH_SIZE,
+            callbacks=[keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=4, restore_best_weights=True)],
+            verbose=2
+        )
+        tag = f's{int(round(sparsity * 100))}'
+        pruned.save(os.path.join(args.output, f'pruned_{tag}.keras'))
+        row = report_row(pruned, sparsity, tag)
+        rows.append(row)
+        print(f"Sparsity {sparsity:.2f}: {row['params']:,} params, {row['latency_ms']:.2f} ms, test acc {row['test_accuracy']:.4f}")
+
+        # Otherwise stop at the first (least sparse) level within budget
+        if args.latency_budget_ms and row['latency_ms'] <= args.latency_budget_ms:
+            print(f"Latency budget {args.latency_budget_ms} ms met at sparsity {sparsity:.2f}")
+            break
+
+    base_acc = rows[0]['test_accuracy']
+    for row in rows:
+        row['accuracy_delta'] = row['test_accuracy'] - base_acc
+        row['meets_budget'] = bool(args.latency_budget_ms) and row['latency_ms'] <= args.latency_budget_ms
+
+    with open(os.path.join(args.output, 'prune_report.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    with open(os.path.join(args.output, 'prune_report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n{'sparsity':>8} {'params':>10} {'tflite_kb':>9} {'latency_ms':>10} {'test_acc':>8} {'delta':>7}")
+    for r in rows:
+        print(f"{r['sparsity']:>8.2f} {r['params']:>10,} {r['tflite_kb']:>9.1f} {r['latency_ms']:>10.2f} {r['test_accuracy']:>8.4f} {r['accuracy_delta']:>+7.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Structured pruning + fine-tuning + TFLite export report')
+    parser.add_argument('--model', required=True, help='Trained best_model.keras')
+    parser.add_argument('--labels', help='label_mapping2.txt of --model (default: next to the model)')
+    parser.add_argument('--data', required=True, help='Path to folder with X.npy (or compact store), y.npy')
+    parser.add_argument('--output', required=True, help='Folder for pruned models and the report')
+    parser.add_argument('--sparsity', default='0.25,0.5,0.75', help='Comma-separated unit sparsity levels')
+    parser.add_argument('--latency_budget_ms', type=float, help='Stop at the first sparsity whose TFLite latency is within budget')
+    parser.add_argument('--finetune_epochs', type=int, default=10)
+    parser.add_argument('--lr', type=float, default=3e-4)
+    parser.add_argument('--classes', help='Comma-separated subset of classes (must match the model)')
+    parser.add_argument('--where', help='SQL filter over sequence_index.db')
+    main(parser.parse_args())
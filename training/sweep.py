@@ -0,0 +1,313 @@
+
+import numpy as np
+import os
+import json
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Hyperparameter sweep / k-fold runner.
+#
+# The dataset is loaded ONCE, written as a float32 memmap of the original (un-augmented)
+# windows into the sweep folder, and every trial process reads batches from that same
+# read-only file. Folds are split over the originals, grouped by source video when
+# sequence_index.db is available, and only the training batches are augmented (on the
+# fly, same variants as augment_dataset) so no form of a validation window is trained on.
+# Trials run in a process pool, each with its own TF thread budget. A median
+# stopping rule prunes trials whose validation accuracy is clearly behind the others
+# at the same epoch.
+#
+# Search space (JSON): each key is a build_model() keyword or an optimizer/fit setting.
+#   {
+#     "width": [128, 256],                         # list -> grid axis / uniform choice
+#     "dense_units": [[256, 128], [512, 256]],
+#     "dropout": [[0.3, 0.2], [0.4, 0.3]],
+#     "learning_rate": {"log_uniform": [1e-4, 3e-3]},  # random mode only
+#     "weight_decay": {"log_uniform": [1e-5, 1e-3]},
+#     "batch_size": [32, 64]
+#   }
+
+TRAIN_KEYS = {'learning_rate', 'weight_decay', 'batch_size'}
+DEFAULT_TRAIN = {'learning_rate': 1e-3, 'weight_decay': 1e-4, 'batch_size': 32}
+
+def grid_trials(space):
+    keys = sorted(space)
+    for key in keys:
+        if not isinstance(space[key], list):
+            raise ValueError(f"Grid mode needs a list of values for '{key}'")
+    for values in itertools.product(*(space[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+def random_trials(space, num_trials, seed=42):
+    rng = np.random.default_rng(seed)
+    for _ in range(num_trials):
+        params = {}
+        for key, spec in sorted(space.items()):
+            if isinstance(spec, list):
+                params[key] = spec[rng.integers(len(spec))]
+            elif 'log_uniform' in spec:
+                lo, hi = spec['log_uniform']
+                params[key] = float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+            elif 'uniform' in spec:
+                params[key] = float(rng.uniform(*spec['uniform']))
+            elif 'int' in spec:
+                params[key] = int(rng.integers(spec['int'][0], spec['int'][1] + 1))
+            else:
+                raise ValueError(f"Unknown search spec for '{key}': {spec}")
+        yield params
+
+LEADERBOARD_FIELDS = ['trial', 'status', 'val_accuracy', 'val_accuracy_std', 'folds_run', 'params',
+                      'tflite_kb', 'tflite_latency_ms', 'train_minutes', 'hparams', 'error']
+
+def make_folds(y, num_folds, groups=None, seed=42):
+    """
+    Stratified k-fold (train_idx, val_idx) pairs over the original windows. num_folds=1 ->
+    single ~85/15 holdout, matching train_model.py. With groups (source video per window),
+    all windows of a video land on the same side of every split.
+    """
+    from sklearn.model_selection import StratifiedKFold, StratifiedGroupKFold, train_test_split
+    indices = np.arange(len(y))
+    if groups is not None:
+        # 1 fold: first split of a 7-fold grouped split (~15% validation)
+        sgkf = StratifiedGroupKFold(n_splits=num_folds if num_folds > 1 else 7, shuffle=True, random_state=seed)
+        folds = [(train_idx, val_idx) for train_idx, val_idx in sgkf.split(indices, y, groups)]
+        return folds if num_folds > 1 else folds[:1]
+    if num_folds <= 1:
+        train_idx, val_idx = train_test_split(indices, test_size=0.15, random_state=seed, stratify=y)
+        return [(np.sort(train_idx), np.sort(val_idx))]
+    skf = StratifiedKFold(n_splits=num_folds, shuffle=True, random_state=seed)
+    return [(train_idx, val_idx) for train_idx, val_idx in skf.split(indices, y)]
+
+def prepare_shared_dataset(data_path, work_dir, classes=None, where=None):
+    """
+    Loads once and writes the original windows as X_shared.npy (float32) / y_shared.npy
+    for the workers. Returns (num_classes, groups); groups is the source video of each
+    window, or None without sequence_index.db.
+    """
+    from train_model import load_dataset
+    from sequence_index import has_index, query_videos
+    X, y, label_map = load_dataset(data_path, classes, where)
+    np.save(os.path.join(work_dir, 'X_shared.npy'), X.astype(np.float32))
+    np.save(os.path.join(work_dir, 'y_shared.npy'), y)
+    groups = np.array(query_videos(data_path, classes, where)) if has_index(data_path) else None
+    return len(label_map), groups
+
+def _init_worker(threads):
+    # Runs in each (spawned) worker before any TF op executes
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _run_trial(trial_id, params, work_dir, num_classes, folds, epochs, curves, prune_warmup, prune_margin, min_peers):
+    """
+    Trains one trial over all folds. Returns a leaderboard row.
+    """
+    from tensorflow import keras
+    from train_model import build_model, export_tflite, measure_tflite_latency, augment_variant, NUM_AUG_VARIANTS
+
+    X = np.load(os.path.join(work_dir, 'X_shared.npy'), mmap_mode='r')
+    y = np.load(os.path.join(work_dir, 'y_shared.npy'), mmap_mode='r')
+
+    class MemmapBatches(keras.utils.PyDataset):
+        """
+        Reads batches straight from the shared memmap (no per-trial copy of X).
+        With augment, every window yields NUM_AUG_VARIANTS samples (original + the
+        augment_dataset variants), built per batch.
+        """
+        def __init__(self, indices, batch_size, shuffle, augment=False):
+            super().__init__()
+            indices = np.asarray(indices)
+            if augment:
+                # sample code = window * NUM_AUG_VARIANTS + variant
+                indices = (indices[:, None] * NUM_AUG_VARIANTS + np.arange(NUM_AUG_VARIANTS)).ravel()
+            self.indices = indices
+            self.augment = augment
+            self.batch_size = batch_size
+            self.shuffle = shuffle
+            self.on_epoch_end()
+
+        def __len__(self):
+            return (len(self.indices) + self.batch_size - 1) // self.batch_size
+
+        def __getitem__(self, i):
+            batch = np.sort(self.indices[i * self.batch_size:(i + 1) * self.batch_size])
+            if not self.augment:
+                return np.asarray(X[batch]), keras.utils.to_categorical(y[batch], num_classes)
+            windows, variants = batch // NUM_AUG_VARIANTS, batch % NUM_AUG_VARIANTS
+            X_batch = np.asarray(X[windows])
+            for v in np.unique(variants):
+                rows = variants == v
+                X_batch[rows] = augment_variant(X_batch[rows], v)
+            return X_batch, keras.utils.to_categorical(y[windows], num_classes)
+
+        def on_epoch_end(self):
+            if self.shuffle:
+                np.random.shuffle(self.indices)
+
+    class MedianPruning(keras.callbacks.Callback):
+        """
+        Stops the trial when its best val_accuracy so far is more than prune_margin below
+        the median of other trials at the same epoch (same fold).
+        """
+        def __init__(self, key, fold):
+            super().__init__()
+            self.key = key
+            self.fold = fold
+            self.history = []
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.history.append(float(logs.get('val_accuracy', 0.0)))
+            curves[self.key] = list(self.history)
+            if epoch + 1 < prune_warmup:
+                return
+            peers = [max(c[:epoch + 1]) for k, c in curves.items()
+                     if k != self.key and k.endswith(f':{self.fold}') and len(c) > epoch]
+            if len(peers) >= min_peers and max(self.history) < np.median(peers) - prune_margin:
+                self.pruned = True
+                self.model.stop_training = True
+
+    model_kwargs = {k: tuple(v) if isinstance(v, list) else v for k, v in params.items() if k not in TRAIN_KEYS}
+    train_cfg = {**DEFAULT_TRAIN, **{k: v for k, v in params.items() if k in TRAIN_KEYS}}
+
+    start = time.time()
+    fold_acc = []
+    pruned = False
+    for fold, (train_idx, val_idx) in enumerate(folds):
+        keras.backend.clear_session()
+        model = build_model(num_classes, **model_kwargs)
+        model.compile(optimizer=keras.optimizers.AdamW(learning_rate=train_cfg['learning_rate'],
+                                                       weight_decay=train_cfg['weight_decay']),
+                      loss='categorical_crossentropy', metrics=['accuracy'])
+        pruning = MedianPruning(f'{trial_id}:{fold}', fold)
+        history = model.fit(
+            MemmapBatches(train_idx, int(train_cfg['batch_size']), shuffle=True, augment=True),
+            validation_data=MemmapBatches(val_idx, 256, shuffle=False),
+            epochs=epochs,
+            callbacks=[pruning, keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=8, restore_best_weights=True)],
+            verbose=0
+        )
+        fold_acc.append(max(history.history['val_accuracy']))
+        if pruning.pruned:
+            pruned = True
+            break
+
+    row = {
+        'trial': trial_id,
+        'status': 'pruned' if pruned else 'complete',
+        'val_accuracy': float(np.mean(fold_acc)),
+        'val_accuracy_std': float(np.std(fold_acc)),
+        'folds_run': len(fold_acc),
+        'params': int(model.count_params()),
+        'tflite_kb': None,
+        'tflite_latency_ms': None,
+        'train_minutes': (time.time() - start) / 60,
+        'hparams': json.dumps(params),
+        'error': None
+    }
+    if not pruned:
+        tflite_path = os.path.join(work_dir, f'trial_{trial_id:03d}.tflite')
+        try:
+            row['tflite_kb'] = export_tflite(model, tflite_path) / 1024
+            row['tflite_latency_ms'] = measure_tflite_latency(tflite_path)
+        except Exception as e:
+            # Keep the accuracy result, the trial itself trained fine
+            row['error'] = f"tflite: {e}"
+    return row
+
+def failed_row(trial_id, params, error):
+    row = dict.fromkeys(LEADERBOARD_FIELDS)
+    row.update({'trial': trial_id, 'status': 'failed', 'folds_run': 0,
+                'hparams': json.dumps(params), 'error': f"{type(error).__name__}: {error}"})
+    return row
+
+def write_leaderboard(rows, output_dir):
+    # Completed trials first, then pruned, then failed; by accuracy within each
+    order = {'complete': 0, 'pruned': 1, 'failed': 2}
+    rows = sorted(rows, key=lambda r: (order[r['status']], -(r['val_accuracy'] or 0.0)))
+    with open(os.path.join(output_dir, 'leaderboard.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=LEADERBOARD_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(output_dir, 'leaderboard.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+
+    if not rows:
+        print("\nNo trials were run.")
+        return rows
+    print(f"\n{'#':>3} {'status':>8} {'val_acc':>8} {'params':>10} {'tflite_ms':>9}  hparams")
+    for r in rows:
+        acc = f"{r['val_accuracy']:.4f}" if r['val_accuracy'] is not None else '-'
+        params = f"{r['params']:,}" if r['params'] is not None else '-'
+        latency = f"{r['tflite_latency_ms']:.2f}" if r['tflite_latency_ms'] is not None else '-'
+        print(f"{r['trial']:>3} {r['status']:>8} {acc:>8} {params:>10} {latency:>9}  {r['hparams']}")
+        if r['error']:
+            print(f"{'':>3} {'':>8} error: {r['error']}")
+    return rows
+
+def main(args):
+    os.makedirs(args.output, exist_ok=True)
+    with open(args.space, 'r') as f:
+        space = json.load(f)
+    if args.mode == 'grid':
+        trials = list(grid_trials(space))
+    else:
+        trials = list(random_trials(space, args.trials, args.seed))
+    print(f"{len(trials)} trials, {args.folds} fold(s), {args.workers} workers x {args.threads} threads")
+
+    classes = args.classes.split(',') if args.classes else None
+    num_classes, groups = prepare_shared_dataset(args.data, args.output, classes, args.where)
+    if groups is None:
+        print("No sequence_index.db: folds are split by window, windows of one video may straddle train/val")
+    folds = make_folds(np.load(os.path.join(args.output, 'y_shared.npy')), args.folds, groups, args.seed)
+
+    # Spawn (not fork): TF must not be inherited half-initialized from the parent
+    ctx = mp.get_context('spawn')
+    with ctx.Manager() as manager:
+        curves = manager.dict()
+        rows = []
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(args.threads,)) as pool:
+            futures = {pool.submit(_run_trial, i, params, args.output, num_classes, folds, args.epochs,
+                                   curves, args.prune_warmup, args.prune_margin, args.min_peers): i
+                       for i, params in enumerate(trials)}
+            for future in as_completed(futures):
+                trial_id = futures[future]
+                try:
+                    row = future.result()
+                    print(f"Trial {row['trial']} {row['status']}: val_acc={row['val_accuracy']:.4f}")
+                except Exception as e:
+                    # A crashed trial (or worker) must not take the rest of the sweep down
+                    row = failed_row(trial_id, trials[trial_id], e)
+                    print(f"Trial {trial_id} failed: {row['error']}")
+                rows.append(row)
+
+    write_leaderboard(rows, args.output)
+    if not args.keep_data:
+        os.remove(os.path.join(args.output, 'X_shared.npy'))
+        os.remove(os.path.join(args.output, 'y_shared.npy'))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep over a shared memmapped dataset')
+    parser.add_argument('--data', required=True, help='Path to folder with X.npy (or compact store), y.npy')
+    parser.add_argument('--space', required=True, help='Search space JSON')
+    parser.add_argument('--output', required=True, help='Sweep folder (shared memmap, TFLite files, leaderboard)')
+    parser.add_argument('--mode', choices=['grid', 'random'], default='random')
+    parser.add_argument('--trials', type=int, default=16, help='Number of random trials')
+    parser.add_argument('--folds', type=int, default=1, help='k for stratified (video-grouped) k-fold (1 = ~85/15 holdout)')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    parser.add_argument('--threads', type=int, default=4, help='TF intra-op threads per trial')
+    parser.add_argument('--prune_warmup', type=int, default=5, help='Epochs before pruning can kick in')
+    parser.add_argument('--prune_margin', type=float, default=0.05, help='Accuracy gap below the median that counts as clearly losing')
+    parser.add_argument('--min_peers', type=int, default=3, help='Other trials needed at an epoch before pruning')
+    parser.add_argument('--classes', help='Comma-separated subset of classes')
+    parser.add_argument('--where', help='SQL filter over sequence_index.db')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep_data', action='store_true', help='Keep X_shared.npy after the sweep')
+    main(parser.parse_args())
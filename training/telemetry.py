@@ -0,0 +1,252 @@
+
+import numpy as np
+import os
+import sys
+import csv
+import json
+import time
+import tensorflow as tf
+from tensorflow import keras
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Training resource telemetry.
+#
+# Per step:  step time (train_step wall time, measured by the batch hooks) and input wait,
+#            measured at the data source: training batches are served by TimedBatches,
+#            which timestamps each batch when it is ready. Keras prefetches batches on a
+#            background thread, so a step only waits when its batch became ready after
+#            the step started: wait = max(0, ready - step start). This is an upper bound
+#            when the step does other work before taking the batch (tracing on the first
+#            step). Batch production time (fetch) is logged too; prefetching hides it as
+#            long as it is below step time.
+# Per epoch: wall time, model compute (step time minus input wait), throughput,
+#            validation/other time, peak RSS, TF allocator memory.
+# Written to <log_dir>/telemetry_steps.csv and <log_dir>/telemetry.json, with a summary
+# that says whether the time went to the model, the input pipeline or overhead.
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: no resource module, psutil reports the peak working set
+        if psutil is None:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _current_rss_mb():
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def _tf_allocator_mb():
+    """
+    Current/peak TF allocator memory per GPU. CPU-only runs have no allocator stats.
+    """
+    stats = {}
+    for i, _ in enumerate(tf.config.list_physical_devices('GPU')):
+        try:
+            info = tf.config.experimental.get_memory_info(f'GPU:{i}')
+            stats[f'GPU:{i}'] = {'current_mb': info['current'] / 2**20, 'peak_mb': info['peak'] / 2**20}
+        except (ValueError, RuntimeError):
+            pass
+    return stats or None
+
+class TimedBatches(keras.utils.PyDataset):
+    """
+    In-memory (X, y) batches, reshuffled every epoch like model.fit(X, y), that record
+    (fetch time, ready timestamp) for each batch in the order they are produced.
+    """
+    def __init__(self, X, y, batch_size, shuffle=True):
+        super().__init__()
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.indices = np.arange(len(X))
+        self.produced = []
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (len(self.indices) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, i):
+        start = time.perf_counter()
+        batch = self.indices[i * self.batch_size:(i + 1) * self.batch_size]
+        X_batch, y_batch = self.X[batch], self.y[batch]
+        ready = time.perf_counter()
+        self.produced.append((ready - start, ready))
+        return X_batch, y_batch
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.indices)
+
+class TrainingTelemetry(keras.callbacks.Callback):
+    """
+    Records step time, input wait, memory and throughput during model.fit().
+    batches: the TimedBatches being trained on; without it input wait is not measured.
+    """
+    def __init__(self, log_dir, batch_size, batches=None):
+        super().__init__()
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.batches = batches
+        self.epochs = []
+        os.makedirs(log_dir, exist_ok=True)
+
+    def on_train_begin(self, logs=None):
+        self._steps_file = open(os.path.join(self.log_dir, 'telemetry_steps.csv'), 'w', newline='')
+        self._steps = csv.writer(self._steps_file)
+        self._steps.writerow(['epoch', 'step', 'step_ms', 'input_wait_ms', 'fetch_ms'])
+        self._train_start = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._step_times = []
+        self._waits = []
+        self._fetches = []
+        if self.batches is not None:
+            # The epoch's iterator (and its prefetching) starts after this hook,
+            # so the k-th batch produced from here on feeds step k
+            self.batches.produced.clear()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        end = time.perf_counter()
+        step = end - self._step_start
+        self._step_times.append(step)
+        wait = fetch = None
+        k = len(self._step_times) - 1
+        if self.batches is not None and k < len(self.batches.produced):
+            fetch, ready = self.batches.produced[k]
+            wait = min(max(ready - self._step_start, 0.0), step)
+            self._waits.append(wait)
+            self._fetches.append(fetch)
+        self._steps.writerow([len(self.epochs), batch, f'{step * 1000:.3f}',
+                              f'{wait * 1000:.3f}' if wait is not None else '',
+                              f'{fetch * 1000:.3f}' if fetch is not None else ''])
+
+    def on_epoch_end(self, epoch, logs=None):
+        wall = time.perf_counter() - self._epoch_start
+        step_total = float(np.sum(self._step_times))
+        measured = self.batches is not None and len(self._waits) == len(self._step_times)
+        wait = float(np.sum(self._waits)) if measured else None
+        steps = len(self._step_times)
+        self.epochs.append({
+            'epoch': epoch,
+            'steps': steps,
+            'wall_s': wall,
+            'step_s': step_total,
+            'input_wait_s': wait,
+            'compute_s': step_total - (wait or 0.0),
+            'fetch_s': float(np.sum(self._fetches)) if measured else None,
+            # Iterator setup, validation, checkpointing and other epoch-end callbacks
+            'other_s': max(wall - step_total, 0.0),
+            'step_ms_median': float(np.median(self._step_times) * 1000) if steps else None,
+            'step_ms_p95': float(np.percentile(self._step_times, 95) * 1000) if steps else None,
+            'samples_per_s': steps * self.batch_size / step_total if step_total > 0 else None,
+            'peak_rss_mb': _peak_rss_mb(),
+            'rss_mb': _current_rss_mb(),
+            'tf_memory': _tf_allocator_mb()
+        })
+        self._steps_file.flush()
+
+    def on_train_end(self, logs=None):
+        self._steps_file.close()
+        summary = self.summary()
+        with open(os.path.join(self.log_dir, 'telemetry.json'), 'w') as f:
+            json.dump({'summary': summary, 'epochs': self.epochs}, f, indent=2)
+        print("\n--- Training Telemetry ---")
+        for line in summary['findings']:
+            print(line)
+
+    def summary(self):
+        """
+        Aggregates the epochs and points out where the time went.
+        The first epoch is reported separately: it includes tracing/graph building.
+        """
+        if not self.epochs:
+            return {'findings': ["No epochs recorded."]}
+        steady = self.epochs[1:] or self.epochs
+        wall = sum(e['wall_s'] for e in steady)
+        measured = all(e['input_wait_s'] is not None for e in steady)
+        shares = {
+            'model': sum(e['compute_s'] for e in steady) / wall,
+            'input': sum(e['input_wait_s'] for e in steady) / wall if measured else None,
+            'other': sum(e['other_s'] for e in steady) / wall
+        }
+        rss = [e['peak_rss_mb'] for e in self.epochs if e['peak_rss_mb'] is not None]
+        peak_rss = max(rss) if rss else None
+        throughput = [e['samples_per_s'] for e in steady if e['samples_per_s']]
+
+        input_share = f"{shares['input']:.0%}" if measured else 'n/a'
+        findings = [
+            f"Total: {time.perf_counter() - self._train_start:.1f}s over {len(self.epochs)} epochs "
+            f"(first epoch {self.epochs[0]['wall_s']:.1f}s incl. tracing)",
+            f"Time split (steady epochs): model {shares['model']:.0%}, "
+            f"input wait {input_share}, "
+            f"iterator setup/validation/callbacks {shares['other']:.0%}",
+            f"Throughput: {np.median(throughput):.0f} samples/s, median step {np.median([e['step_ms_median'] for e in steady]):.1f} ms"
+            if throughput else "Throughput: n/a",
+            f"Peak RSS: {peak_rss:.0f} MB" if peak_rss is not None else "Peak RSS: n/a"
+        ]
+        if measured:
+            fetch_ms = sum(e['fetch_s'] for e in steady) / max(sum(e['steps'] for e in steady), 1) * 1000
+            findings.append(f"Input: {fetch_ms:.1f} ms to produce a batch (overlaps compute when prefetched)")
+            findings.append("Note: input wait is for the instrumented TimedBatches pipeline used with telemetry; "
+                            "runs without it feed arrays through Keras' own input pipeline, whose wait can differ")
+        gpu = self.epochs[-1]['tf_memory']
+        if gpu:
+            for device, mem in gpu.items():
+                findings.append(f"TF allocator {device}: peak {mem['peak_mb']:.0f} MB")
+
+        # Verdict
+        if psutil is not None and peak_rss is not None and peak_rss > 0.8 * psutil.virtual_memory().total / 2**20:
+            findings.append("Bottleneck: memory pressure (peak RSS above 80% of system RAM), expect swapping")
+        elif measured and shares['input'] > 0.2:
+            findings.append("Bottleneck: input pipeline (>20% of epoch time waiting for batches)")
+        elif shares['other'] > 0.3:
+            findings.append("Bottleneck: iterator setup/validation/callbacks (>30% of epoch time outside training steps)")
+        else:
+            findings.append("Bottleneck: model compute")
+
+        step_stats = [e['step_ms_p95'] / e['step_ms_median'] for e in steady if e['step_ms_median']]
+        if step_stats and np.median(step_stats) > 2.0:
+            findings.append("Note: p95 step time is over 2x the median, steps are irregular (GC, retracing or contention)")
+        return {'shares': shares, 'peak_rss_mb': peak_rss, 'findings': findings}
+
+def telemetry_callbacks(log_dir, batches, profile_steps=None):
+    """
+    Telemetry callback for training on `batches` (TimedBatches) plus, optionally, a
+    TensorBoard profiler capture over profile_steps=(start, stop) training steps of the
+    first epoch.
+    """
+    callbacks = [TrainingTelemetry(log_dir, batches.batch_size, batches)]
+    if profile_steps:
+        if len(profile_steps) != 2 or not all(isinstance(v, int) for v in profile_steps) \
+                or not 0 < profile_steps[0] <= profile_steps[1]:
+            raise ValueError(f"profile_steps must be two step numbers start,stop with 0 < start <= stop, got {profile_steps}")
+        callbacks.append(keras.callbacks.TensorBoard(log_dir=os.path.join(log_dir, 'profile'),
+                                                     profile_batch=tuple(profile_steps)))
+    return callbacks
+
+def telemetry_fit_inputs(X, y, batch_size, log_dir=None, profile_steps=None):
+    """
+    Returns (model.fit() data kwargs, extra callbacks). Without log_dir: the plain arrays
+    and no callbacks. With log_dir, batches are served by TimedBatches so input wait is
+    measured where they are produced; this replaces Keras' array pipeline for that run.
+    """
+    if not log_dir:
+        return {'x': X, 'y': y, 'batch_size': batch_size}, []
+    batches = TimedBatches(X, y, batch_size)
+    return {'x': batches}, telemetry_callbacks(log_dir, batches, profile_steps)
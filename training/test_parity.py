@@ -3,6 +3,12 @@ import numpy as np
 import tensorflow as tf
 import argparse
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataprep'))
+from landmark_store import load_X
+from sequence_index import query_sequences
+from train_model import read_label_mapping
 
 def test_tflite_model(model_path, debug_sequence_path):
     print(f"Loading TFLite model: {model_path}")
@@ -39,9 +45,54 @@ def test_tflite_model(model_path, debug_sequence_path):
     # Softmax check
     print("Sum of probs (Should be 1.0):", np.sum(output_data))
 
+def evaluate_tflite_subset(model_path, labels_path, data_path, classes=None, where=None):
+    """
+    Accuracy of the TFLite model on windows selected via sequence_index.db.
+    Only the matching rows of X are read. Targets come from the model's own
+    label_mapping2.txt by class name, so subset-trained (remapped) models score correctly.
+    """
+    model_labels = read_label_mapping(labels_path)
+    offsets, _, names = query_sequences(data_path, classes, where)
+    known = np.array([name in model_labels for name in names], dtype=bool)
+    if not known.all():
+        unknown = sorted(set(name for name, k in zip(names, known) if not k))
+        print(f"Skipping {int((~known).sum())} sequences of classes the model does not know: {unknown}")
+    offsets = offsets[known]
+    labels = np.array([model_labels[name] for name in names if name in model_labels], dtype=np.int64)
+    print(f"Evaluating {len(offsets)} selected sequences")
+    if len(offsets) == 0:
+        return
+
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+
+    correct = 0
+    for start in range(0, len(offsets), 256):
+        batch = load_X(data_path, offsets[start:start + 256])
+        for seq, label in zip(batch, labels[start:start + 256]):
+            interpreter.set_tensor(input_details[0]['index'], seq.reshape(1, 30, 171))
+            interpreter.invoke()
+            output_data = interpreter.get_tensor(output_details[0]['index'])[0]
+            correct += int(np.argmax(output_data) == label)
+
+    print(f"Accuracy: {correct / len(offsets):.4f} ({correct}/{len(offsets)})")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--model', required=True)
-    parser.add_argument('--seq', required=True)
+    parser.add_argument('--seq', help='debug_sequence.npy for the single-sequence parity check')
+    parser.add_argument('--data', help='dataprep output folder to evaluate a subset on')
+    parser.add_argument('--classes', help='Comma-separated class names (with --data)')
+    parser.add_argument('--where', help='SQL filter over sequence_index.db (with --data)')
+    parser.add_argument('--labels', help='label_mapping2.txt of the model (default: next to --model)')
     args = parser.parse_args()
-    test_tflite_model(args.model, args.seq)
+    if not args.seq and not args.data:
+        parser.error('one of --seq or --data is required')
+    if args.seq:
+        test_tflite_model(args.model, args.seq)
+    if args.data:
+        labels_path = args.labels or os.path.join(os.path.dirname(os.path.abspath(args.model)), 'label_mapping2.txt')
+        evaluate_tflite_subset(args.model, labels_path, args.data,
+                               args.classes.split(',') if args.classes else None, args.where)
@@ -7,6 +7,13 @@ from keras import layers
 import matplotlib.pyplot as plt
 import json
 import argparse
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataprep'))
+from landmark_store import load_X
+from sequence_index import query_sequences, has_index
+from telemetry import telemetry_fit_inputs
 
 # Config
 SEQ_LENGTH = 30
@@ -14,49 +21,76 @@ INPUT_DIM = 171
 BATCH_SIZE = 32
 EPOCHS = 50
 
-def build_model(num_classes):
+def build_model(num_classes, width=256, gru_units=128, num_heads=4, key_dim=64,
+                dense_units=(512, 256), spatial_dropout=0.2, dropout=(0.4, 0.3), l2=0.001):
     """
     Builds an advanced architecture for Sign Language Recognition.
     Features: Residual connections, Spatial Dropout, and Multi-Head Attention.
+    Defaults are the production sizes; the keyword arguments exist for sweeps (sweep.py).
     """
     inputs = layers.Input(shape=(SEQ_LENGTH, INPUT_DIM))
     
     # 1. Feature Normalization & Projection
     # Project 171 dims to a higher dimensional space for better feature extraction
-    x = layers.Dense(256, activation='gelu')(inputs)
+    x = layers.Dense(width, activation='gelu')(inputs)
     x = layers.BatchNormalization()(x)
     
     # 2. Temporal Feature Extraction (Conv1D Stack)
     # Using 'same' padding to maintain temporal resolution for skip connections
-    res = layers.Conv1D(256, kernel_size=3, padding='same', activation='gelu')(x)
+    res = layers.Conv1D(width, kernel_size=3, padding='same', activation='gelu')(x)
     x = layers.Add()([x, res]) # Skip connection
-    x = layers.SpatialDropout1D(0.2)(x)
+    x = layers.SpatialDropout1D(spatial_dropout)(x)
     
     # 3. Recurrent Temporal Logic (Bidirectional GRU)
     # GRU is often more efficient than LSTM for TFLite on mobile
-    x = layers.Bidirectional(layers.GRU(128, return_sequences=True))(x)
+    x = layers.Bidirectional(layers.GRU(gru_units, return_sequences=True))(x)
     x = layers.BatchNormalization()(x)
     
     # 4. Global Context (Self-Attention)
     # Allows the model to weigh different frames in the 30-frame sequence
-    attn_out = layers.MultiHeadAttention(num_heads=4, key_dim=64)(x, x)
+    attn_out = layers.MultiHeadAttention(num_heads=num_heads, key_dim=key_dim)(x, x)
     x = layers.LayerNormalization()(attn_out + x) # Residual Attention
     
     # 5. Pooling & Classification Head
     x = layers.GlobalAveragePooling1D()(x)
     
-    x = layers.Dense(512, activation='gelu')(x)
+    x = layers.Dense(dense_units[0], activation='gelu')(x)
     x = layers.BatchNormalization()(x)
-    x = layers.Dropout(0.4)(x)
+    x = layers.Dropout(dropout[0])(x)
     
-    x = layers.Dense(256, activation='gelu', kernel_regularizer=keras.regularizers.l2(0.001))(x)
-    x = layers.Dropout(0.3)(x)
+    x = layers.Dense(dense_units[1], activation='gelu', kernel_regularizer=keras.regularizers.l2(l2))(x)
+    x = layers.Dropout(dropout[1])(x)
     
     outputs = layers.Dense(num_classes, activation='softmax')(x)
     
     model = keras.Model(inputs=inputs, outputs=outputs)
     return model
 
+def load_dataset(data_path, classes=None, where=None):
+    """
+    Loads X (float32), integer labels and label_map from a dataprep output folder.
+    With classes/where, only the matching windows are read (via sequence_index.db and
+    memory-mapped X), and labels are remapped to the selected classes in original order.
+    """
+    with open(os.path.join(data_path, 'label_map.json'), 'r') as f:
+        label_map = json.load(f)
+    
+    if not classes and not where:
+        X = load_X(data_path) # X.npy or compact store, dequantized to float32
+        y = np.load(os.path.join(data_path, 'y.npy'))
+        return X, y, label_map
+    
+    offsets, labels, _ = query_sequences(data_path, classes, where)
+    if len(offsets) == 0:
+        raise ValueError(f"No sequences match classes={classes} where={where}")
+    X = load_X(data_path, offsets)
+    
+    # Keep only classes present in the selection, contiguous and in original order
+    old_to_new = {old: new for new, old in enumerate(sorted(set(labels.tolist())))}
+    y = np.array([old_to_new[l] for l in labels])
+    label_map = {label: old_to_new[idx] for label, idx in label_map.items() if idx in old_to_new}
+    return X, y, label_map
+
 def plot_history(history):
     acc = history.history['accuracy']
     val_acc = history.history.get('val_accuracy', [])
@@ -77,50 +111,36 @@ def plot_history(history):
     plt.title('Loss')
     plt.savefig('training_history.png')
 
-def main(data_path, model_save_path):
-    # 1. Load Data
-    print(f"Loading data from {data_path}...")
-    X = np.load(os.path.join(data_path, 'X.npy'))
-    y = np.load(os.path.join(data_path, 'y.npy'))
-    
-    # Load labels
-    with open(os.path.join(data_path, 'label_map.json'), 'r') as f:
-        label_map = json.load(f)
-    classes = list(label_map.keys())
-    NUM_CLASSES = len(classes)
-    
-    print(f"Loaded {X.shape[0]} samples with {NUM_CLASSES} classes.")
-    
-    # Convert labels to categorical
-    y = keras.utils.to_categorical(y, NUM_CLASSES)
-    
-    # 2. Advanced Augmentation (In-Memory Jitter, Rotation, Mirroring)
-    X_original = X.copy()
-    y_original = y.copy()
-    
-    X_aug_list = []
-    y_aug_list = []
-    
+NUM_AUG_VARIANTS = 5
+
+def augment_variant(X, variant):
+    """
+    Applies one augmentation to a batch of windows (N, 30, 171):
+    0 original, 1 jitter, 2 rotation, 3 mirror, 4 missing frames.
+    """
+    if variant == 0:
+        return X.copy()
+
     # a. Gaussian Jitter (simulate sensor noise)
-    noise = np.random.normal(0, 0.003, X.shape)
-    X_aug_list.append(X + noise)
-    y_aug_list.append(y)
-    
+    if variant == 1:
+        noise = np.random.normal(0, 0.003, X.shape)
+        return X + noise
+
     # b. 90-Degree Rotation (Simulate portrait/landscape mismatch)
     # (x, y) -> (y, 1-x)
-    X_rot = X.copy()
-    X_rot[:, :, 0::3] = X[:, :, 1::3] # new x = old y
-    X_rot[:, :, 1::3] = 1.0 - X[:, :, 0::3] # new y = 1 - old x
-    X_aug_list.append(X_rot)
-    y_aug_list.append(y)
-    
+    if variant == 2:
+        X_rot = X.copy()
+        X_rot[:, :, 0::3] = X[:, :, 1::3] # new x = old y
+        X_rot[:, :, 1::3] = 1.0 - X[:, :, 0::3] # new y = 1 - old x
+        return X_rot
+
     # c. Front-Camera Mirroring Augmentation (Already in dataprep, but reinforcing here)
     # (x, y) -> (1-x, y)
-    X_mirror = X.copy()
-    X_mirror[:, :, 0::3] = 1.0 - X[:, :, 0::3]
-    X_aug_list.append(X_mirror)
-    y_aug_list.append(y)
-    
+    if variant == 3:
+        X_mirror = X.copy()
+        X_mirror[:, :, 0::3] = 1.0 - X[:, :, 0::3]
+        return X_mirror
+
     # d. Missing-Frame Augmentation (Simulate tracking loss/occlusion)
     # Randomly zero out 1-3 frames in some sequences
     X_missing = X.copy()
@@ -129,11 +149,234 @@ def main(data_path, model_save_path):
             num_missing = np.random.randint(1, 4)
             indices = np.random.choice(range(SEQ_LENGTH), num_missing, replace=False)
             X_missing[i, indices, :] = 0
-    X_aug_list.append(X_missing)
-    y_aug_list.append(y)
+    return X_missing
+
+def augment_dataset(X, y):
+    """
+    Advanced Augmentation (In-Memory Jitter, Rotation, Mirroring, Missing Frames).
+    Returns the originals followed by 4 augmented copies: (5N, 30, 171), (5N, ...)
+    """
+    X = np.concatenate([augment_variant(X, v) for v in range(NUM_AUG_VARIANTS)], axis=0)
+    y = np.concatenate([y] * NUM_AUG_VARIANTS, axis=0)
+    return X, y
+
+def export_tflite(model, tflite_path):
+    """
+    Converts a Keras model to TFLite (Optimized for Mobile) and writes it to tflite_path.
+    Returns the size in bytes.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.target_spec.supported_ops = [
+      tf.lite.OpsSet.TFLITE_BUILTINS, # Enable TensorFlow Lite ops.
+      tf.lite.OpsSet.SELECT_TF_OPS # Enable TensorFlow ops.
+    ]
+    # Use float16 quantization for better mobile performance if accuracy allows
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    tflite_model = converter.convert()
+    
+    with open(tflite_path, 'wb') as f:
+        f.write(tflite_model)
+    return len(tflite_model)
+
+def measure_tflite_latency(tflite_path, runs=50, warmup=5, num_threads=1):
+    """
+    Median single-sequence invoke() latency in milliseconds on this machine.
+    """
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()
+    sample = np.random.random((1, SEQ_LENGTH, INPUT_DIM)).astype(np.float32)
+    
+    timings = []
+    for i in range(warmup + runs):
+        interpreter.set_tensor(input_details[0]['index'], sample)
+        start = time.perf_counter()
+        interpreter.invoke()
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def save_label_mapping(label_map, path):
+    """
+    Writes label_mapping2.txt ("label,idx" per line, sorted by idx) for the app.
+    """
+    with open(path, 'w') as f:
+        sorted_labels = sorted(label_map.items(), key=lambda item: item[1])
+        for label, idx in sorted_labels:
+            f.write(f"{label},{idx}\n")
+
+def read_label_mapping(path):
+    label_map = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                label, idx = line.rstrip('\n').rsplit(',', 1)
+                label_map[label] = int(idx)
+    return label_map
+
+def sample_replay(replay_path, label_map, per_class, seed=42):
+    """
+    Picks up to per_class old windows per class from a previous dataprep output
+    (via sequence_index.db when present) and returns them with labels in label_map indices.
+    """
+    rng = np.random.default_rng(seed)
+    with open(os.path.join(replay_path, 'label_map.json'), 'r') as f:
+        replay_map = json.load(f)
+    
+    if has_index(replay_path):
+        offsets, labels, _ = query_sequences(replay_path)
+    else:
+        labels = np.load(os.path.join(replay_path, 'y.npy'), mmap_mode='r')
+        offsets = np.arange(len(labels))
+    
+    chosen, chosen_labels = [], []
+    for label, idx in replay_map.items():
+        if label not in label_map:
+            continue
+        candidates = offsets[np.asarray(labels) == idx]
+        if len(candidates) == 0:
+            continue
+        picked = rng.choice(candidates, min(per_class, len(candidates)), replace=False)
+        chosen.extend(picked)
+        chosen_labels.extend([label_map[label]] * len(picked))
+    
+    order = np.argsort(chosen)
+    X = load_X(replay_path, np.asarray(chosen)[order])
+    return X, np.asarray(chosen_labels)[order]
+
+def extend_classifier(base_model, num_classes):
+    """
+    Replaces the softmax head of a trained model with a wider one. Rows for the
+    existing classes keep their trained weights; new classes start from fresh
+    weights with the mean old bias.
+    """
+    old_head = base_model.layers[-1]
+    kernel, bias = old_head.get_weights()
+    num_old = kernel.shape[1]
+    if num_classes < num_old:
+        raise ValueError(f"Cannot shrink classifier from {num_old} to {num_classes} classes")
+    
+    features = base_model.layers[-2].output
+    new_head = layers.Dense(num_classes, activation='softmax', name=f'classifier_{num_classes}')
+    outputs = new_head(features)
+    model = keras.Model(inputs=base_model.input, outputs=outputs)
+    
+    new_kernel, new_bias = new_head.get_weights()
+    new_kernel[:, :num_old] = kernel
+    new_bias[:num_old] = bias
+    new_bias[num_old:] = bias.mean()
+    new_head.set_weights([new_kernel, new_bias])
+    return model
+
+def _labels_by_index(label_map, y):
+    names = {idx: label for label, idx in label_map.items()}
+    return [names[int(i)] for i in y]
+
+def finetune(data_path, model_save_path, base_model_path, base_labels_path, replay_path=None,
+             replay_per_class=64, freeze_early=False, epochs=15, classes=None, where=None,
+             telemetry_dir=None, profile_steps=None):
+    """
+    Incremental class addition: loads an existing best_model.keras, extends the softmax
+    head with the classes in data_path that it does not know yet, and fine-tunes on the
+    new data plus a small replay buffer of old-class windows.
+    The best weights are checkpointed to <model_save_path>/finetuned_model.keras.
+    """
+    checkpoint_path = os.path.join(model_save_path, 'finetuned_model.keras')
+    if os.path.realpath(checkpoint_path) == os.path.realpath(base_model_path):
+        raise ValueError(f"Fine-tuning checkpoint {checkpoint_path} would overwrite the base model, "
+                         "choose another --save_path or move the base model")
+    label_map = read_label_mapping(base_labels_path)
+    num_old = len(label_map)
+    
+    print(f"Loading new data from {data_path}...")
+    X_new, y_new, new_map = load_dataset(data_path, classes, where)
+    # New classes are appended after the existing indices so the app mapping stays stable
+    for label, _ in sorted(new_map.items(), key=lambda item: item[1]):
+        if label not in label_map:
+            label_map[label] = len(label_map)
+    y_new = np.array([label_map[label] for label in _labels_by_index(new_map, y_new)])
+    NUM_CLASSES = len(label_map)
+    print(f"{num_old} existing + {NUM_CLASSES - num_old} new classes, {len(X_new)} new samples.")
+    
+    X, y = X_new, y_new
+    if replay_path:
+        X_old, y_old = sample_replay(replay_path, label_map, replay_per_class)
+        print(f"Replay buffer: {len(X_old)} old-class samples.")
+        X = np.concatenate([X_new, X_old], axis=0)
+        y = np.concatenate([y_new, y_old], axis=0)
+    
+    # Training the extended head on new classes only wipes out the old ones
+    old_present = set(int(l) for l in y if l < num_old)
+    if not old_present:
+        raise ValueError(f"No windows of the {num_old} existing classes in the training set: pass --replay_data "
+                         "(previous dataprep output) or include old classes in --data")
+    missing = [label for label, idx in label_map.items() if idx < num_old and idx not in old_present]
+    if missing:
+        print(f"WARNING: no training windows for {len(missing)} existing classes, they will likely be forgotten: {missing}")
+    
+    y = keras.utils.to_categorical(y, NUM_CLASSES)
+    X, y = augment_dataset(X, y)
+    
+    from sklearn.model_selection import train_test_split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.15, random_state=42)
+    print(f"Fine-tuning on {X_train.shape[0]} samples. Validation: {X_test.shape[0]}")
+    
+    base_model = keras.models.load_model(base_model_path)
+    if base_model.output_shape[-1] != num_old:
+        raise ValueError(f"{base_model_path} has {base_model.output_shape[-1]} outputs but {base_labels_path} lists {num_old} classes")
+    model = extend_classifier(base_model, NUM_CLASSES)
+    
+    if freeze_early:
+        # Freeze the temporal encoder (projection, Conv1D, BiGRU); attention + head keep training
+        for layer in model.layers:
+            layer.trainable = False
+            if isinstance(layer, layers.Bidirectional):
+                break
+    
+    # Lower LR than from-scratch training to avoid wiping the old classes
+    optimizer = keras.optimizers.AdamW(learning_rate=3e-4, weight_decay=1e-4)
+    model.compile(optimizer=optimizer, 
+                  loss='categorical_crossentropy', 
+                  metrics=['accuracy'])
     
-    X = np.concatenate([X_original] + X_aug_list, axis=0)
-    y = np.concatenate([y_original] + y_aug_list, axis=0)
+    callbacks = [
+        keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=5, restore_best_weights=True),
+        keras.callbacks.ModelCheckpoint(filepath=checkpoint_path, monitor='val_accuracy', save_best_only=True)
+    ]
+    train_data, telemetry = telemetry_fit_inputs(X_train, y_train, BATCH_SIZE, telemetry_dir, profile_steps)
+    callbacks += telemetry
+    
+    history = model.fit(
+        **train_data,
+        validation_data=(X_test, y_test),
+        epochs=epochs,
+        callbacks=callbacks
+    )
+    
+    plot_history(history)
+    
+    print("Exporting to TFLite...")
+    tflite_path = os.path.join(model_save_path, 'model.tflite')
+    export_tflite(model, tflite_path)
+    print(f"Model saved to {tflite_path}")
+    
+    save_label_mapping(label_map, os.path.join(model_save_path, 'label_mapping2.txt'))
+    print("Label mapping saved.")
+
+def main(data_path, model_save_path, classes=None, where=None, telemetry_dir=None, profile_steps=None):
+    # 1. Load Data (optionally a subset selected through sequence_index.db)
+    print(f"Loading data from {data_path}...")
+    X, y, label_map = load_dataset(data_path, classes, where)
+    classes = list(label_map.keys())
+    NUM_CLASSES = len(classes)
+    
+    print(f"Loaded {X.shape[0]} samples with {NUM_CLASSES} classes.")
+    
+    # Convert labels to categorical
+    y = keras.utils.to_categorical(y, NUM_CLASSES)
+    
+    # 2. Advanced Augmentation (In-Memory Jitter, Rotation, Mirroring)
+    X, y = augment_dataset(X, y)
     
     # 3. Split
     from sklearn.model_selection import train_test_split
@@ -158,12 +401,13 @@ def main(data_path, model_save_path):
         keras.callbacks.ReduceLROnPlateau(monitor='val_loss', patience=7, factor=0.5, min_lr=1e-6),
         keras.callbacks.ModelCheckpoint(filepath='best_model.keras', monitor='val_accuracy', save_best_only=True)
     ]
+    train_data, telemetry = telemetry_fit_inputs(X_train, y_train, BATCH_SIZE, telemetry_dir, profile_steps)
+    callbacks += telemetry
     
     history = model.fit(
-        X_train, y_train,
+        **train_data,
         validation_data=(X_test, y_test),
         epochs=100, # Increased epochs
-        batch_size=BATCH_SIZE,
         callbacks=callbacks
     )
     
@@ -171,34 +415,48 @@ def main(data_path, model_save_path):
     
     # 5. TFLite Export (Optimized for Mobile)
     print("Exporting to TFLite...")
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
-    converter.target_spec.supported_ops = [
-      tf.lite.OpsSet.TFLITE_BUILTINS, # Enable TensorFlow Lite ops.
-      tf.lite.OpsSet.SELECT_TF_OPS # Enable TensorFlow ops.
-    ]
-    # Use float16 quantization for better mobile performance if accuracy allows
-    converter.optimizations = [tf.lite.Optimize.DEFAULT]
-    tflite_model = converter.convert()
-    
     tflite_path = os.path.join(model_save_path, 'model.tflite')
-    with open(tflite_path, 'wb') as f:
-        f.write(tflite_model)
-        
+    export_tflite(model, tflite_path)
     print(f"Model saved to {tflite_path}")
     
     # Save Label Mapping for App
-    with open(os.path.join(model_save_path, 'label_mapping2.txt'), 'w') as f:
-        sorted_labels = sorted(label_map.items(), key=lambda item: item[1])
-        for label, idx in sorted_labels:
-            f.write(f"{label},{idx}\n")
-            
+    save_label_mapping(label_map, os.path.join(model_save_path, 'label_mapping2.txt'))
     print("Label mapping saved.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', required=True, help='Path to folder with X.npy, y.npy')
     parser.add_argument('--save_path', required=True, help='Output folder')
+    parser.add_argument('--classes', help='Comma-separated subset of classes to train on')
+    parser.add_argument('--where', help="SQL filter over sequence_index.db, e.g. \"mirrored = 0 AND video LIKE 'signer3_%%'\"")
+    # Incremental class addition
+    parser.add_argument('--finetune', help='Existing best_model.keras to extend with the new classes in --data')
+    parser.add_argument('--base_labels', help='label_mapping2.txt of the --finetune model (default: <save_path>/label_mapping2.txt)')
+    parser.add_argument('--replay_data', help='Previous dataprep output to sample old-class replay windows from '
+                        '(required unless --data already contains the old classes)')
+    parser.add_argument('--replay_per_class', type=int, default=64, help='Replay windows per old class')
+    parser.add_argument('--freeze_early', action='store_true', help='Freeze layers up to and including the BiGRU')
+    parser.add_argument('--finetune_epochs', type=int, default=15)
+    # Resource telemetry
+    parser.add_argument('--telemetry', help='Folder for step-time/input-wait/memory logs. Training batches are then served '
+                        'by an instrumented PyDataset instead of the arrays, so input wait describes that pipeline')
+    parser.add_argument('--profile_steps', help='TensorBoard profiler window as start,stop steps (with --telemetry)')
     args = parser.parse_args()
     
     os.makedirs(args.save_path, exist_ok=True)
-    main(args.data, args.save_path)
+    classes = args.classes.split(',') if args.classes else None
+    profile_steps = None
+    if args.profile_steps:
+        try:
+            profile_steps = [int(v) for v in args.profile_steps.split(',')]
+        except ValueError:
+            parser.error(f"--profile_steps must be two integers start,stop, got '{args.profile_steps}'")
+        if len(profile_steps) != 2 or not 0 < profile_steps[0] <= profile_steps[1]:
+            parser.error(f"--profile_steps must be two integers start,stop with 0 < start <= stop, got '{args.profile_steps}'")
+    if args.finetune:
+        base_labels = args.base_labels or os.path.join(args.save_path, 'label_mapping2.txt')
+        finetune(args.data, args.save_path, args.finetune, base_labels, args.replay_data,
+                 args.replay_per_class, args.freeze_early, args.finetune_epochs, classes, args.where,
+                 args.telemetry, profile_steps)
+    else:
+        main(args.data, args.save_path, classes, args.where, args.telemetry, profile_steps)